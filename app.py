@@ -1,44 +1,178 @@
-from flask import Flask
 import os
-from extensions import db, csrf, mail
+import tempfile
+from functools import lru_cache
+from types import MappingProxyType
 
-def create_app():
-    """Application factory pattern"""
+# Database configuration - use absolute path for SQLite
+_BASEDIR = os.path.abspath(os.path.dirname(__file__))
+_DEFAULT_DB_URI = 'sqlite:///' + os.path.join(_BASEDIR, 'instance', 'masterclass_portal.db')
+
+# URI баз данных, для которых схема уже создана в этом процессе
+_schema_ready = set()
+
+
+@lru_cache(maxsize=1)
+def _load_config():
+    """
+    Снимок конфигурации из переменных окружения (читается один раз за процесс).
+    Для перечитывания окружения: _load_config.cache_clear()
+    """
+    env = dict(os.environ)
+    cache_url = env.get('CACHE_REDIS_URL')
+    return MappingProxyType({
+        'SECRET_KEY': env.get('SECRET_KEY') or 'dev-secret-key-change-in-production',
+        'SQLALCHEMY_DATABASE_URI': env.get('DATABASE_URL') or _DEFAULT_DB_URI,
+        # Mail configuration
+        'MAIL_SERVER': env.get('MAIL_SERVER') or 'localhost',
+        'MAIL_PORT': int(env.get('MAIL_PORT') or 587),
+        'MAIL_USE_TLS': env.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1'],
+        'MAIL_USERNAME': env.get('MAIL_USERNAME'),
+        'MAIL_PASSWORD': env.get('MAIL_PASSWORD'),
+        'MAIL_DEFAULT_SENDER': env.get('MAIL_DEFAULT_SENDER') or 'noreply@masterclass-portal.com',
+        # Cache configuration: без CACHE_REDIS_URL - кэш в памяти процесса
+        'CACHE_REDIS_URL': cache_url,
+        # ETag списков админ-панели строятся на версиях данных в кэше: без общего для
+        # воркеров Redis изменение на одном воркере не видно другому (устаревшие 304)
+        'ADMIN_ETAGS_ENABLED': env.get('ADMIN_ETAGS_ENABLED', 'true' if cache_url else 'false').lower() in ['true', 'on', '1'],
+        # Sessions: без SESSION_REDIS_URL - подписанная cookie-сессия Flask
+        'SESSION_REDIS_URL': env.get('SESSION_REDIS_URL'),
+        # Кэш пользователей участвует в авторизации: по умолчанию только с общим Redis
+        'USER_CACHE_ENABLED': env.get('USER_CACHE_ENABLED', 'true' if cache_url else 'false').lower() in ['true', 'on', '1'],
+        # Вход: не более LOGIN_RATE_LIMIT попыток с одного адреса за LOGIN_RATE_WINDOW секунд.
+        # Счетчик живет в кэше: без CACHE_REDIS_URL лимит действует отдельно в каждом воркере
+        'LOGIN_RATE_LIMIT': int(env.get('LOGIN_RATE_LIMIT') or 10),
+        'LOGIN_RATE_WINDOW': int(env.get('LOGIN_RATE_WINDOW') or 60),
+        # Число обратных прокси перед приложением: адрес клиента и схема берутся
+        # из X-Forwarded-For/-Proto только при значении > 0 (иначе их можно подделать)
+        'TRUSTED_PROXY_COUNT': int(env.get('TRUSTED_PROXY_COUNT') or 0),
+        # Templates: без явного значения файлы шаблонов перепроверяются только в режиме debug
+        'TEMPLATES_AUTO_RELOAD': (env['TEMPLATES_AUTO_RELOAD'].lower() in ['true', 'on', '1']
+                                  if 'TEMPLATES_AUTO_RELOAD' in env else None),
+        'JINJA_BYTECODE_CACHE_DIR': env.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'jinja_cache'),
+    })
+
+
+def _engine_options(database_uri):
+    """Параметры движка и пула соединений SQLAlchemy для указанной БД"""
+    # Кэш скомпилированных SQL-выражений (по умолчанию 500 записей)
+    options = {'query_cache_size': 1200}
+    if database_uri.startswith('sqlite'):
+        # Для SQLite пул выбирает Flask-SQLAlchemy (StaticPool для :memory:),
+        # режим журнала настраивается в extensions.py
+        return options
+    options.update({
+        'pool_size': 20,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pool_recycle': 1800,  # 30 минут
+        'pool_pre_ping': True,
+    })
+    return options
+
+
+def _configure_jinja(app):
+    """Кэш скомпилированных шаблонов: без auto_reload и с байткодом на диске (общий для воркеров)"""
+    from jinja2 import FileSystemBytecodeCache
+    
+    # templates_auto_reload учитывает debug, если TEMPLATES_AUTO_RELOAD не задан
+    app.jinja_env.auto_reload = app.templates_auto_reload
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def _configure_sessions(app):
+    """
+    Сессии в Redis через Flask-Session, если задан SESSION_REDIS_URL: в cookie
+    остается только подписанный ID сессии, данные не передаются с каждым запросом
+    """
+    url = app.config['SESSION_REDIS_URL']
+    if not url:
+        return
+    # redis и Flask-Session - необязательные зависимости, нужны только при SESSION_REDIS_URL
+    import redis
+    from flask_session import Session
+    
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.Redis.from_url(url)
+    app.config['SESSION_USE_SIGNER'] = True
+    # Как и cookie-сессия: до закрытия браузера, запись в Redis живет PERMANENT_SESSION_LIFETIME
+    app.config['SESSION_PERMANENT'] = False
+    app.config.setdefault('SESSION_KEY_PREFIX', 'session:')
+    Session(app)
+
+
+def _configure_proxy(app):
+    """
+    Адрес клиента за обратным прокси (nginx): без ProxyFix request.remote_addr -
+    адрес прокси, и лимит попыток входа становится общим для всех клиентов
+    """
+    count = app.config['TRUSTED_PROXY_COUNT']
+    if count:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count)
+
+
+def _configure_json(app):
+    """jsonify() через orjson, если он установлен (иначе - стандартный провайдер Flask)"""
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return
+    from json_provider import ORJSONProvider
+    app.json = ORJSONProvider(app)
+
+
+def create_app(config=None):
+    """
+    Application factory pattern
+    config - настройки поверх окружения (например, БД для тестов): _load_config
+    читает окружение один раз за процесс, поэтому менять os.environ после этого бесполезно
+    """
+    # Flask и расширения импортируются лениво, чтобы `import app`
+    # в CLI-скриптах не тянул за собой весь граф зависимостей
+    from flask import Flask
+    from extensions import db, csrf, mail, cache, compress
+    
     app = Flask(__name__)
     
     # Configuration
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    
-    # Database configuration - use absolute path for SQLite
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'instance', 'masterclass_portal.db')
+    app.config.update(_load_config())
+    if config:
+        app.config.update(config)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
     
-    # Session configuration
-    app.config['SESSION_TYPE'] = 'filesystem'
-    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+    # Сжатие ответов (gzip/brotli): JSON поиска и автодополнения сжимается в 5-10 раз
+    app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/css']
+    app.config['COMPRESS_LEVEL'] = 5
     
-    # Mail configuration
-    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER') or 'localhost'
-    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT') or 587)
-    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@masterclass-portal.com'
+    # Session configuration - подписанная cookie-сессия Flask или Redis (SESSION_REDIS_URL)
+    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
     
     # Initialize extensions with app
     db.init_app(app)
     csrf.init_app(app)
     mail.init_app(app)
+    cache.init_app(app)
+    compress.init_app(app)
+    _configure_jinja(app)
+    _configure_json(app)
+    _configure_sessions(app)
+    _configure_proxy(app)
     
-    # Import models and services to ensure they are registered with SQLAlchemy
-    with app.app_context():
-        from models import User, EventCreator, Masterclass, Registration
-        from services import (UserService, EventCreatorService, MasterclassService, 
-                            RegistrationService, EmailService, AdminService)
-        # Create database tables
-        db.create_all()
+    # Create database tables once per database in this process.
+    # In-memory SQLite gets a fresh database for every engine, so it is never marked ready
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if database_uri not in _schema_ready:
+        # Import models to ensure they are registered with SQLAlchemy
+        import models  # noqa: F401
+        # Flask-SQLAlchemy 3.x не принимает app в create_all, контекст обязателен
+        with app.app_context():
+            db.create_all()
+        if ':memory:' not in database_uri:
+            _schema_ready.add(database_uri)
     
     # Register blueprints
     from routes import public_bp
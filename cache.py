@@ -0,0 +1,218 @@
+"""
+Кэш приложения: TTL-кэш в памяти процесса или Redis (если задан CACHE_REDIS_URL)
+"""
+import functools
+import pickle
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class MemoryBackend:
+    """TTL-кэш в памяти процесса (для одного воркера и тестов)"""
+
+    def __init__(self, max_entries=10000):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            if len(self._data) >= self._max_entries:
+                self._evict_expired()
+            if len(self._data) >= self._max_entries:
+                self._data.clear()
+            self._data[key] = (time.monotonic() + timeout, value)
+
+    def incr(self, key, timeout):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                entry = (now + timeout, 0)
+            expires_at, value = entry
+            self._data[key] = (expires_at, value + 1)
+            return value + 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at < now]:
+            del self._data[key]
+
+
+class RedisBackend:
+    """Общий для всех воркеров кэш в Redis (значения сериализуются pickle)"""
+
+    def __init__(self, url, prefix):
+        # redis - необязательная зависимость, нужна только при CACHE_REDIS_URL
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, timeout):
+        self._client.set(self._prefix + key, pickle.dumps(value), ex=int(timeout))
+
+    def incr(self, key, timeout):
+        # Счетчик хранится как число Redis (не pickle) - читать только через incr.
+        # SET NX EX и INCR в одной транзакции: TTL ставится вместе с созданием ключа,
+        # и счетчик не остается бессрочным, если процесс упал между командами
+        key = self._prefix + key
+        pipe = self._client.pipeline()
+        pipe.set(key, 0, ex=int(timeout), nx=True)
+        pipe.incr(key)
+        _, value = pipe.execute()
+        return value
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self._prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self._prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+class Cache:
+    """
+    Расширение Flask для кэширования.
+    Каждое приложение получает собственное хранилище; вне контекста приложения
+    и при CACHE_ENABLED = False все операции - пустые.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+        app.config.setdefault('CACHE_KEY_PREFIX', 'mc:')
+
+        if app.config['CACHE_REDIS_URL']:
+            backend = RedisBackend(app.config['CACHE_REDIS_URL'], app.config['CACHE_KEY_PREFIX'])
+        else:
+            backend = MemoryBackend()
+        app.extensions['cache'] = backend
+        app.jinja_env.add_extension(FragmentCacheExtension)
+
+    @staticmethod
+    def _backend():
+        if not has_app_context() or not current_app.config.get('CACHE_ENABLED'):
+            return None
+        return current_app.extensions.get('cache')
+
+    def get(self, key):
+        backend = self._backend()
+        return backend.get(key) if backend is not None else None
+
+    def set(self, key, value, timeout=None):
+        backend = self._backend()
+        if backend is not None:
+            if timeout is None:
+                timeout = current_app.config['CACHE_DEFAULT_TIMEOUT']
+            backend.set(key, value, timeout)
+
+    def incr(self, key, timeout):
+        """
+        Увеличить счетчик на 1 и вернуть новое значение; окно timeout отсчитывается
+        от первого увеличения. При выключенном кэше - None.
+        """
+        backend = self._backend()
+        return backend.incr(key, timeout) if backend is not None else None
+
+    def delete(self, *keys):
+        backend = self._backend()
+        if backend is not None:
+            backend.delete(*keys)
+
+    def clear(self):
+        backend = self._backend()
+        if backend is not None:
+            backend.clear()
+
+
+def per_request_cache(func):
+    """
+    Мемоизация результата на время одного HTTP-запроса (хранится в g._cache).
+    Вне контекста запроса функция вызывается как обычно.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not has_request_context():
+            return func(*args, **kwargs)
+        store = g.setdefault('_cache', {})
+        key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+        if key not in store:
+            store[key] = func(*args, **kwargs)
+        return store[key]
+    return wrapper
+
+
+def clear_request_cache():
+    """Сбросить мемоизированные в текущем запросе значения (после изменения данных)"""
+    if has_request_context():
+        g.pop('_cache', None)
+
+
+def fragment_cache_key(*parts):
+    """Ключ фрагмента шаблона: {% cache timeout, part1, part2 %} -> fragment:part1:part2"""
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Тег {% cache timeout, key_part, ... %}...{% endcache %} - кэширует
+    отрендеренный HTML фрагмента шаблона в кэше приложения.
+    timeout 0 - фрагмент рендерится заново и не кэшируется
+    (например, когда данные страницы неполные)
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        self._cache = Cache()
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, args, caller):
+        timeout, *parts = args
+        if not timeout:
+            return caller()
+        key = fragment_cache_key(*parts)
+        html = self._cache.get(key)
+        if html is None:
+            html = caller()
+            self._cache.set(key, html, timeout)
+        return html
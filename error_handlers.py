@@ -8,14 +8,33 @@ from sqlalchemy.exc import (
     DataError, InvalidRequestError
 )
 from werkzeug.exceptions import HTTPException
+from datetime import datetime
+from extensions import db
 import logging
 
 logger = logging.getLogger(__name__)
 
+_HOURS_PER_SECOND = 1 / 3600
+
 
 class MasterclassError(Exception):
-    """Базовый класс для ошибок мастер-классов"""
-    pass
+    """
+    Базовый класс для ошибок мастер-классов.
+    Подклассы хранят исходные поля в __slots__ и передают их в args
+    (для pickle), а текст сообщения собирается в _format_message()
+    только при первом обращении к str().
+    """
+    __slots__ = ('_msg',)
+    
+    def _format_message(self):
+        return super().__str__()
+    
+    def __str__(self):
+        try:
+            return self._msg
+        except AttributeError:
+            self._msg = self._format_message()
+            return self._msg
 
 
 class MasterclassFullError(MasterclassError):
@@ -23,9 +42,14 @@ class MasterclassFullError(MasterclassError):
     Исключение для заполненных мастер-классов
     Требование: 1.4
     """
+    __slots__ = ('masterclass_title',)
+    
     def __init__(self, masterclass_title):
         self.masterclass_title = masterclass_title
-        super().__init__(f"Мастер-класс '{masterclass_title}' полностью заполнен")
+        super().__init__(masterclass_title)
+    
+    def _format_message(self):
+        return f"Мастер-класс '{self.masterclass_title}' полностью заполнен"
 
 
 class RegistrationError(MasterclassError):
@@ -33,7 +57,7 @@ class RegistrationError(MasterclassError):
     Исключение для ошибок регистрации
     Требование: 2.3
     """
-    pass
+    __slots__ = ()
 
 
 class DuplicateRegistrationError(RegistrationError):
@@ -41,10 +65,15 @@ class DuplicateRegistrationError(RegistrationError):
     Исключение для повторной регистрации
     Требование: 2.3, 2.5
     """
+    __slots__ = ('email', 'masterclass_title')
+    
     def __init__(self, email, masterclass_title):
         self.email = email
         self.masterclass_title = masterclass_title
-        super().__init__(f"Пользователь {email} уже зарегистрирован на '{masterclass_title}'")
+        super().__init__(email, masterclass_title)
+    
+    def _format_message(self):
+        return f"Пользователь {self.email} уже зарегистрирован на '{self.masterclass_title}'"
 
 
 class TimeConstraintError(MasterclassError):
@@ -52,8 +81,14 @@ class TimeConstraintError(MasterclassError):
     Исключение для нарушения временных ограничений
     Требование: 3.4
     """
-    def __init__(self, message):
+    __slots__ = ('message',)
+    
+    def __init__(self, message=None):
+        self.message = message
         super().__init__(message)
+    
+    def _format_message(self):
+        return self.message
 
 
 class CancellationTooLateError(TimeConstraintError):
@@ -61,12 +96,18 @@ class CancellationTooLateError(TimeConstraintError):
     Исключение для отмены регистрации менее чем за 24 часа
     Требование: 3.4
     """
+    __slots__ = ('masterclass_title', 'hours_remaining')
+    
     def __init__(self, masterclass_title, hours_remaining):
         self.masterclass_title = masterclass_title
         self.hours_remaining = hours_remaining
-        super().__init__(
-            f"Отмена регистрации на '{masterclass_title}' невозможна: "
-            f"до начала осталось {hours_remaining:.1f} часов (требуется минимум 24 часа)"
+        super().__init__()
+        self.args = (masterclass_title, hours_remaining)
+    
+    def _format_message(self):
+        return (
+            f"Отмена регистрации на '{self.masterclass_title}' невозможна: "
+            f"до начала осталось {self.hours_remaining:.1f} часов (требуется минимум 24 часа)"
         )
 
 
@@ -75,9 +116,14 @@ class DatabaseConnectionError(MasterclassError):
     Исключение для ошибок подключения к базе данных
     Требование: 5.4
     """
+    __slots__ = ('original_error',)
+    
     def __init__(self, original_error):
         self.original_error = original_error
-        super().__init__(f"Ошибка подключения к базе данных: {str(original_error)}")
+        super().__init__(original_error)
+    
+    def _format_message(self):
+        return f"Ошибка подключения к базе данных: {str(self.original_error)}"
 
 
 class DataValidationError(MasterclassError):
@@ -85,9 +131,39 @@ class DataValidationError(MasterclassError):
     Исключение для ошибок валидации данных
     Требование: 5.1
     """
+    __slots__ = ('field', 'message')
+    
     def __init__(self, field, message):
         self.field = field
-        super().__init__(f"Ошибка валидации поля '{field}': {message}")
+        self.message = message
+        super().__init__(field, message)
+    
+    def _format_message(self):
+        return f"Ошибка валидации поля '{self.field}': {self.message}"
+
+
+# Сообщения для известных ограничений целостности.
+# SQLite не сообщает имя ограничения, только таблицу и колонки
+_INTEGRITY_ERROR_MESSAGES = {
+    'unique_registration_per_masterclass': "Вы уже зарегистрированы на этот мастер-класс.",
+    'registration.masterclass_id, registration.user_email': "Вы уже зарегистрированы на этот мастер-класс.",
+    # Секции registration в PostgreSQL сообщают имя своего индекса, ключ - в DETAIL
+    'Key (masterclass_id, user_email)=': "Вы уже зарегистрированы на этот мастер-класс.",
+}
+
+
+def _integrity_error_message(error):
+    """
+    Сообщение пользователю для IntegrityError.
+    Проверяется только короткое сообщение драйвера (error.orig), а не
+    полный текст исключения SQLAlchemy с SQL-запросом и параметрами.
+    """
+    orig_args = getattr(error.orig, 'args', None) or ('',)
+    detail = str(orig_args[0])
+    for constraint, message in _INTEGRITY_ERROR_MESSAGES.items():
+        if constraint in detail:
+            return message
+    return "Ошибка сохранения данных. Возможно, такая запись уже существует."
 
 
 def handle_database_error(error):
@@ -95,7 +171,7 @@ def handle_database_error(error):
     Обработчик ошибок базы данных
     Требование: 5.4
     """
-    logger.error(f"Database error: {str(error)}", exc_info=True)
+    logger.error("Database error: %s", error, exc_info=True)
     
     if isinstance(error, OperationalError):
         # Ошибки подключения или операционные ошибки
@@ -106,12 +182,9 @@ def handle_database_error(error):
     
     elif isinstance(error, IntegrityError):
         # Нарушение ограничений целостности
-        error_message = "Ошибка сохранения данных. Возможно, такая запись уже существует."
-        if 'unique_registration_per_masterclass' in str(error):
-            error_message = "Вы уже зарегистрированы на этот мастер-класс."
         return render_template(
             'errors/database_error.html',
-            error_message=error_message
+            error_message=_integrity_error_message(error)
         ), 400
     
     elif isinstance(error, DataError):
@@ -134,7 +207,7 @@ def handle_masterclass_full_error(error):
     Обработчик ошибки заполненного мастер-класса
     Требование: 1.4
     """
-    logger.warning(f"Masterclass full: {str(error)}")
+    logger.warning("Masterclass full: %s", error)
     flash(f"К сожалению, все места на мастер-класс '{error.masterclass_title}' заняты.", 'warning')
     return redirect(url_for('public.index'))
 
@@ -144,7 +217,7 @@ def handle_duplicate_registration_error(error):
     Обработчик ошибки повторной регистрации
     Требование: 2.3, 2.5
     """
-    logger.info(f"Duplicate registration attempt: {str(error)}")
+    logger.info("Duplicate registration attempt: %s", error)
     flash(
         f"Вы уже зарегистрированы на мастер-класс '{error.masterclass_title}'. "
         f"Проверьте свои регистрации по email {error.email}.",
@@ -158,7 +231,7 @@ def handle_time_constraint_error(error):
     Обработчик ошибок временных ограничений
     Требование: 3.4
     """
-    logger.warning(f"Time constraint violation: {str(error)}")
+    logger.warning("Time constraint violation: %s", error)
     flash(str(error), 'error')
     return redirect(request.referrer or url_for('public.index'))
 
@@ -168,11 +241,40 @@ def handle_validation_error(error):
     Обработчик ошибок валидации данных
     Требование: 5.1
     """
-    logger.warning(f"Validation error: {str(error)}")
+    logger.warning("Validation error: %s", error)
     flash(str(error), 'error')
     return redirect(request.referrer or url_for('public.index'))
 
 
+# Таблица обработчиков кастомных ошибок по точному типу исключения
+_CUSTOM_ERROR_HANDLERS = {
+    MasterclassFullError: handle_masterclass_full_error,
+    DuplicateRegistrationError: handle_duplicate_registration_error,
+    TimeConstraintError: handle_time_constraint_error,
+    DataValidationError: handle_validation_error,
+}
+
+
+def dispatch_masterclass_error(error):
+    """
+    Выбор обработчика кастомной ошибки
+    Требования: 1.4, 2.3, 3.4, 5.1
+    
+    Сначала точный тип ищется в таблице, затем - ближайший базовый класс
+    (например, CancellationTooLateError обрабатывается как TimeConstraintError).
+    Ошибки без обработчика пробрасываются дальше.
+    """
+    handler = _CUSTOM_ERROR_HANDLERS.get(type(error))
+    if handler is None:
+        for error_class in type(error).__mro__[1:]:
+            handler = _CUSTOM_ERROR_HANDLERS.get(error_class)
+            if handler is not None:
+                break
+        else:
+            raise error
+    return handler(error)
+
+
 def register_error_handlers(app):
     """
     Регистрация всех обработчиков ошибок в приложении
@@ -183,65 +285,35 @@ def register_error_handlers(app):
     @app.errorhandler(404)
     def not_found_error(error):
         """Обработчик ошибки 404 - страница не найдена"""
-        logger.warning(f"404 error: {request.url}")
+        logger.warning("404 error: %s", request.url)
         return render_template('errors/404.html'), 404
     
     @app.errorhandler(403)
     def forbidden_error(error):
         """Обработчик ошибки 403 - доступ запрещен"""
-        logger.warning(f"403 error: {request.url}")
+        logger.warning("403 error: %s", request.url)
         return render_template('errors/403.html'), 403
     
     @app.errorhandler(500)
     def internal_error(error):
         """Обработчик ошибки 500 - внутренняя ошибка сервера"""
-        logger.error(f"500 error: {str(error)}", exc_info=True)
-        from extensions import db
+        logger.error("500 error: %s", error, exc_info=True)
         db.session.rollback()
         return render_template('errors/500.html'), 500
     
-    # Обработчики ошибок базы данных
-    @app.errorhandler(OperationalError)
-    def handle_operational_error(error):
-        """Обработчик операционных ошибок БД - Требование: 5.4"""
-        from extensions import db
-        db.session.rollback()
-        return handle_database_error(error)
-    
-    @app.errorhandler(IntegrityError)
-    def handle_integrity_error(error):
-        """Обработчик ошибок целостности БД - Требование: 5.4"""
-        from extensions import db
-        db.session.rollback()
-        return handle_database_error(error)
-    
+    # Обработчик ошибок базы данных. OperationalError, IntegrityError и DataError
+    # наследуются от DatabaseError; ветвление по типу - в handle_database_error
     @app.errorhandler(DatabaseError)
     def handle_general_database_error(error):
-        """Обработчик общих ошибок БД - Требование: 5.4"""
-        from extensions import db
+        """Обработчик ошибок БД - Требование: 5.4"""
         db.session.rollback()
         return handle_database_error(error)
     
-    # Обработчики кастомных ошибок
-    @app.errorhandler(MasterclassFullError)
-    def handle_full_masterclass(error):
-        """Обработчик заполненных мастер-классов - Требование: 1.4"""
-        return handle_masterclass_full_error(error)
-    
-    @app.errorhandler(DuplicateRegistrationError)
-    def handle_duplicate_registration(error):
-        """Обработчик повторной регистрации - Требование: 2.3"""
-        return handle_duplicate_registration_error(error)
-    
-    @app.errorhandler(TimeConstraintError)
-    def handle_time_constraint(error):
-        """Обработчик временных ограничений - Требование: 3.4"""
-        return handle_time_constraint_error(error)
-    
-    @app.errorhandler(DataValidationError)
-    def handle_data_validation(error):
-        """Обработчик ошибок валидации - Требование: 5.1"""
-        return handle_validation_error(error)
+    # Обработчик кастомных ошибок - Требования: 1.4, 2.3, 3.4, 5.1
+    @app.errorhandler(MasterclassError)
+    def handle_masterclass_error(error):
+        """Единый обработчик ошибок мастер-классов с диспетчеризацией по типу"""
+        return dispatch_masterclass_error(error)
     
     logger.info("Error handlers registered successfully")
 
@@ -262,8 +334,6 @@ def safe_database_operation(operation, *args, **kwargs):
     Raises:
         DatabaseConnectionError: При ошибках подключения к БД
     """
-    from extensions import db
-    
     try:
         result = operation(*args, **kwargs)
         db.session.commit()
@@ -271,22 +341,22 @@ def safe_database_operation(operation, *args, **kwargs):
     
     except OperationalError as e:
         db.session.rollback()
-        logger.error(f"Database operational error: {str(e)}", exc_info=True)
+        logger.error("Database operational error: %s", e, exc_info=True)
         raise DatabaseConnectionError(e)
     
     except IntegrityError as e:
         db.session.rollback()
-        logger.error(f"Database integrity error: {str(e)}", exc_info=True)
+        logger.error("Database integrity error: %s", e, exc_info=True)
         raise
     
     except DatabaseError as e:
         db.session.rollback()
-        logger.error(f"Database error: {str(e)}", exc_info=True)
+        logger.error("Database error: %s", e, exc_info=True)
         raise DatabaseConnectionError(e)
     
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Unexpected error in database operation: {str(e)}", exc_info=True)
+        logger.error("Unexpected error in database operation: %s", e, exc_info=True)
         raise
 
 
@@ -316,15 +386,15 @@ def validate_time_constraint_for_cancellation(masterclass):
     Raises:
         CancellationTooLateError: Если до начала осталось менее 24 часов
     """
-    from datetime import datetime
+    # Одно чтение часов на проверку вместо двух (is_upcoming + разница)
+    time_until_start = (masterclass.date_time - datetime.utcnow()).total_seconds()
     
-    if not masterclass.is_upcoming:
+    if time_until_start <= 0:
         raise TimeConstraintError(
             f"Мастер-класс '{masterclass.title}' уже прошел. Отмена регистрации невозможна."
         )
     
-    time_until_start = masterclass.date_time - datetime.utcnow()
-    hours_remaining = time_until_start.total_seconds() / 3600
+    hours_remaining = time_until_start * _HOURS_PER_SECOND
     
     if hours_remaining < 24:
         raise CancellationTooLateError(masterclass.title, hours_remaining)
@@ -1,9 +1,34 @@
 """Flask extensions initialization"""
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from flask_mail import Mail
+from flask_compress import Compress
+from cache import Cache
 
 # Initialize extensions
 db = SQLAlchemy()
 csrf = CSRFProtect()
-mail = Mail()
\ No newline at end of file
+mail = Mail()
+compress = Compress()
+cache = Cache()
+
+
+def _casefold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL-журнал для SQLite: чтение не блокирует запись.
+    PY_CASEFOLD - регистронезависимый ключ для Unicode (models.casefold)
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+        dbapi_connection.create_function('py_casefold', 1, _casefold, deterministic=True)
@@ -12,7 +12,106 @@ from wtforms.validators import (
     NumberRange, EqualTo
 )
 from datetime import datetime
-from models import User, Masterclass
+from extensions import db
+
+
+# Варианты выбора для SelectField (неизменяемые, создаются один раз при импорте)
+CATEGORY_CHOICES = (
+    ('programming', 'Программирование'),
+    ('design', 'Дизайн'),
+    ('business', 'Бизнес'),
+    ('marketing', 'Маркетинг'),
+    ('art', 'Искусство'),
+    ('music', 'Музыка'),
+    ('cooking', 'Кулинария'),
+    ('photography', 'Фотография'),
+    ('fitness', 'Фитнес'),
+    ('other', 'Другое'),
+)
+CATEGORY_KEYS = frozenset(value for value, _ in CATEGORY_CHOICES)
+MASTERCLASS_CATEGORY_CHOICES = (('', 'Выберите категорию'),) + CATEGORY_CHOICES
+SEARCH_CATEGORY_CHOICES = (('', 'Все категории'),) + CATEGORY_CHOICES
+
+ROLE_CHOICES = (
+    ('user', 'Пользователь'),
+    ('event_creator', 'Создатель ивентов'),
+    ('admin', 'Администратор'),
+)
+
+MIN_RATING_CHOICES = (
+    ('', 'Любой рейтинг'),
+    ('4.5', '⭐ 4.5+'),
+    ('4.0', '⭐ 4.0+'),
+    ('3.5', '⭐ 3.5+'),
+    ('3.0', '⭐ 3.0+'),
+)
+
+SORT_BY_CHOICES = (
+    ('date', 'Дате'),
+    ('price', 'Цене'),
+    ('popularity', 'Популярности'),
+    ('rating', 'Рейтингу'),
+    ('title', 'Названию'),
+)
+
+SORT_ORDER_CHOICES = (
+    ('asc', 'По возрастанию'),
+    ('desc', 'По убыванию'),
+)
+
+RATING_CHOICES = (
+    ('5', '⭐⭐⭐⭐⭐ Отлично'),
+    ('4', '⭐⭐⭐⭐ Хорошо'),
+    ('3', '⭐⭐⭐ Нормально'),
+    ('2', '⭐⭐ Плохо'),
+    ('1', '⭐ Ужасно'),
+)
+
+
+def parse_iso_datetime(value, fmt):
+    """
+    Быстрый разбор дат фиксированной длины без strptime.
+    Поддерживаются форматы '%Y-%m-%d' и '%Y-%m-%dT%H:%M';
+    для остальных форматов и некорректных строк возвращает None.
+    """
+    if fmt == '%Y-%m-%d':
+        if len(value) != 10 or value[4] != '-' or value[7] != '-':
+            return None
+        digits = value[0:4] + value[5:7] + value[8:10]
+        if not digits.isdigit():
+            return None
+        try:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            return None
+    if fmt == '%Y-%m-%dT%H:%M':
+        if len(value) != 16 or value[10] != 'T' or value[13] != ':':
+            return None
+        date_part = parse_iso_datetime(value[:10], '%Y-%m-%d')
+        time_digits = value[11:13] + value[14:16]
+        if date_part is None or not time_digits.isdigit():
+            return None
+        try:
+            return date_part.replace(hour=int(value[11:13]), minute=int(value[14:16]))
+        except ValueError:
+            return None
+    return None
+
+
+class FastDateTimeField(DateTimeField):
+    """
+    DateTimeField с быстрым разбором ISO-дат (см. parse_iso_datetime).
+    Если строка не в ISO-формате, используется стандартный strptime.
+    """
+    def process_formdata(self, valuelist):
+        if valuelist:
+            date_str = " ".join(valuelist)
+            for fmt in self.format:
+                parsed = parse_iso_datetime(date_str, fmt)
+                if parsed is not None:
+                    self.data = parsed
+                    return
+        super().process_formdata(valuelist)
 
 
 class LoginForm(FlaskForm):
@@ -87,8 +186,10 @@ class UserRegistrationForm(FlaskForm):
         Валидация уникальности email
         Требования: 5.2, 6.2
         """
-        user = User.query.filter_by(email=field.data.lower().strip()).first()
-        if user:
+        from models import User
+        
+        email = field.data.lower().strip()
+        if db.session.query(db.exists().where(User.email == email)).scalar():
             raise ValidationError('Этот email уже зарегистрирован')
 
 
@@ -141,7 +242,7 @@ class MasterclassForm(FlaskForm):
             Length(max=5000, message='Описание не должно превышать 5000 символов')
         ]
     )
-    date_time = DateTimeField(
+    date_time = FastDateTimeField(
         'Дата и время',
         format='%Y-%m-%dT%H:%M',
         validators=[
@@ -165,19 +266,7 @@ class MasterclassForm(FlaskForm):
     )
     category = SelectField(
         'Категория',
-        choices=[
-            ('', 'Выберите категорию'),
-            ('programming', 'Программирование'),
-            ('design', 'Дизайн'),
-            ('business', 'Бизнес'),
-            ('marketing', 'Маркетинг'),
-            ('art', 'Искусство'),
-            ('music', 'Музыка'),
-            ('cooking', 'Кулинария'),
-            ('photography', 'Фотография'),
-            ('fitness', 'Фитнес'),
-            ('other', 'Другое')
-        ],
+        choices=MASTERCLASS_CATEGORY_CHOICES,
         validators=[Optional()]
     )
     submit = SubmitField('Сохранить')
@@ -236,11 +325,7 @@ class AdminUserForm(FlaskForm):
     )
     role = SelectField(
         'Роль',
-        choices=[
-            ('user', 'Пользователь'),
-            ('event_creator', 'Создатель ивентов'),
-            ('admin', 'Администратор')
-        ],
+        choices=ROLE_CHOICES,
         validators=[DataRequired(message='Роль обязательна')]
     )
     is_active = BooleanField('Активен')
@@ -272,8 +357,10 @@ class AdminCreateUserForm(AdminUserForm):
         Валидация уникальности email
         Требования: 5.2, 6.2
         """
-        user = User.query.filter_by(email=field.data.lower().strip()).first()
-        if user:
+        from models import User
+        
+        email = field.data.lower().strip()
+        if db.session.query(db.exists().where(User.email == email)).scalar():
             raise ValidationError('Этот email уже зарегистрирован')
 
 
@@ -284,11 +371,7 @@ class AdminRoleForm(FlaskForm):
     """
     role = SelectField(
         'Роль',
-        choices=[
-            ('user', 'Пользователь'),
-            ('event_creator', 'Создатель ивентов'),
-            ('admin', 'Администратор')
-        ],
+        choices=ROLE_CHOICES,
         validators=[DataRequired(message='Роль обязательна')]
     )
     submit = SubmitField('Назначить роль')
@@ -329,6 +412,11 @@ class AdvancedSearchForm(FlaskForm):
     Форма расширенного поиска мастер-классов
     Требования: 8.1, 8.2, 8.3, 8.4, 8.5
     """
+    class Meta:
+        # Форма отправляется только GET-запросом и ничего не изменяет,
+        # поэтому CSRF-токен не генерируется. При переходе на POST - включить
+        csrf = False
+    
     query = StringField(
         'Поиск',
         validators=[
@@ -338,27 +426,15 @@ class AdvancedSearchForm(FlaskForm):
     )
     category = SelectField(
         'Категория',
-        choices=[
-            ('', 'Все категории'),
-            ('programming', 'Программирование'),
-            ('design', 'Дизайн'),
-            ('business', 'Бизнес'),
-            ('marketing', 'Маркетинг'),
-            ('art', 'Искусство'),
-            ('music', 'Музыка'),
-            ('cooking', 'Кулинария'),
-            ('photography', 'Фотография'),
-            ('fitness', 'Фитнес'),
-            ('other', 'Другое')
-        ],
+        choices=SEARCH_CATEGORY_CHOICES,
         validators=[Optional()]
     )
-    date_from = DateTimeField(
+    date_from = FastDateTimeField(
         'Дата от',
         format='%Y-%m-%d',
         validators=[Optional()]
     )
-    date_to = DateTimeField(
+    date_to = FastDateTimeField(
         'Дата до',
         format='%Y-%m-%d',
         validators=[Optional()]
@@ -381,53 +457,57 @@ class AdvancedSearchForm(FlaskForm):
     )
     min_rating = SelectField(
         'Минимальный рейтинг',
-        choices=[
-            ('', 'Любой рейтинг'),
-            ('4.5', '⭐ 4.5+'),
-            ('4.0', '⭐ 4.0+'),
-            ('3.5', '⭐ 3.5+'),
-            ('3.0', '⭐ 3.0+')
-        ],
+        choices=MIN_RATING_CHOICES,
         validators=[Optional()]
     )
     sort_by = SelectField(
         'Сортировать по',
-        choices=[
-            ('date', 'Дате'),
-            ('price', 'Цене'),
-            ('popularity', 'Популярности'),
-            ('rating', 'Рейтингу'),
-            ('title', 'Названию')
-        ],
+        choices=SORT_BY_CHOICES,
         default='date',
         validators=[Optional()]
     )
     sort_order = SelectField(
         'Порядок',
-        choices=[
-            ('asc', 'По возрастанию'),
-            ('desc', 'По убыванию')
-        ],
+        choices=SORT_ORDER_CHOICES,
         default='asc',
         validators=[Optional()]
     )
     submit = SubmitField('Искать')
     
+    # Поля фильтров; сортировка к ним не относится
+    FILTER_FIELDS = ('query', 'category', 'date_from', 'date_to', 'price_min', 'price_max', 'min_rating')
+    
+    def has_filters(self):
+        """Заполнен ли хотя бы один фильтр (по данным или по сырому вводу)"""
+        for name in self.FILTER_FIELDS:
+            field = self[name]
+            if field.data or any(field.raw_data or ()):
+                return True
+        return False
+    
     def validate(self, extra_validators=None):
         """
         Валидация диапазонов
         Требования: 5.1
         """
+        # Пустой поиск с сортировкой по умолчанию валиден без обхода всех полей
+        if (extra_validators is None and not self.has_filters()
+                and self.sort_by.data == self.sort_by.default
+                and self.sort_order.data == self.sort_order.default):
+            return True
+        
         if not super().validate(extra_validators):
             return False
         
         # Валидация диапазона дат
-        if self.date_to.data and self.date_from.data and self.date_to.data < self.date_from.data:
+        date_from, date_to = self.date_from.data, self.date_to.data
+        if date_to and date_from and date_to < date_from:
             self.date_to.errors.append('Дата "до" не может быть раньше даты "от"')
             return False
         
         # Валидация диапазона цен
-        if self.price_max.data and self.price_min.data and self.price_max.data < self.price_min.data:
+        price_min, price_max = self.price_min.data, self.price_max.data
+        if price_max and price_min and price_max < price_min:
             self.price_max.errors.append('Максимальная цена не может быть меньше минимальной')
             return False
         
@@ -441,13 +521,7 @@ class ReviewForm(FlaskForm):
     """
     rating = SelectField(
         'Рейтинг',
-        choices=[
-            ('5', '⭐⭐⭐⭐⭐ Отлично'),
-            ('4', '⭐⭐⭐⭐ Хорошо'),
-            ('3', '⭐⭐⭐ Нормально'),
-            ('2', '⭐⭐ Плохо'),
-            ('1', '⭐ Ужасно')
-        ],
+        choices=RATING_CHOICES,
         validators=[DataRequired(message='Рейтинг обязателен')],
         coerce=int
     )
@@ -3,11 +3,12 @@
 
 from app import create_app
 from extensions import db
-from models import User, EventCreator, Masterclass, Registration, Review, UserProfile, Favorite, Notification
 
 def init_database():
     """Initialize the database with tables"""
     app = create_app()
+    # Импорт модуля models регистрирует все модели для drop_all/create_all
+    from models import User
     
     with app.app_context():
         # Drop all tables and recreate them
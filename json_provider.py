@@ -0,0 +1,36 @@
+"""
+JSON-провайдер Flask на основе orjson (если пакет установлен)
+"""
+from flask.json.provider import DefaultJSONProvider
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Сериализация jsonify() через orjson - быстрее стандартного json.
+    Типы, которые orjson не поддерживает (Decimal, date и т.п.), и даты
+    (для прежнего формата HTTP-date) передаются в DefaultJSONProvider.default.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        # orjson - необязательная зависимость, провайдер подключается только при ее наличии
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson.dumps(obj, default=self.default, option=self._options).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self._orjson.dumps(obj, default=self.default, option=self._options),
+            mimetype=self.mimetype,
+        )
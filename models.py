@@ -1,40 +1,332 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from extensions import db
+from functools import lru_cache
+from uuid import uuid4
+from flask import current_app
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from sqlalchemy import and_, delete, event, false, func, insert, inspect, select, update
+from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, validates, make_transient_to_detached
+from sqlalchemy.schema import DDL, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.expression import FunctionElement
+from extensions import db, cache
+from cache import fragment_cache_key
 
-class User(db.Model):
+USER_ROLES = ('user', 'event_creator', 'admin')
+
+# Битовые флаги ролей (User.role_flags)
+ROLE_USER = 1
+ROLE_EVENT_CREATOR = 2
+ROLE_ADMIN = 4
+ROLE_FLAGS = {'user': ROLE_USER, 'event_creator': ROLE_EVENT_CREATOR, 'admin': ROLE_ADMIN}
+
+# JSON-колонки: нативный JSONB в PostgreSQL, JSON (текст) в остальных БД
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
+# Число hash-секций таблицы registration в PostgreSQL
+REGISTRATION_PARTITIONS = 8
+
+# Время жизни кэша пользователей и списка доступных мастер-классов (секунды)
+USER_CACHE_TIMEOUT = 300
+AVAILABLE_MASTERCLASSES_CACHE_TIMEOUT = 60
+
+
+def data_version(resource):
+    """
+    Токен версии данных ресурса ('users', 'masterclasses', 'reviews', 'registrations')
+    для ETag страниц админ-панели и ключей кэша аналитики.
+    Любое изменение ресурса сбрасывает токен (bump_data_version), и следующий
+    вызов выдает новый. Без кэша токен каждый раз новый - ETag никогда не совпадет.
+    """
+    key = f'data_version:{resource}'
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        cache.set(key, version, 24 * 3600)
+    return version
+
+
+# Фрагмент карточек статистики на дашборде админ-панели ({% cache 60, 'admin_stats' %})
+ADMIN_STATS_CACHE_KEY = fragment_cache_key('admin_stats')
+
+
+def _data_version_keys(resources):
+    keys = [f'data_version:{resource}' for resource in resources]
+    if {'users', 'masterclasses', 'registrations'} & set(resources):
+        keys.append(ADMIN_STATS_CACHE_KEY)
+    return keys
+
+
+def bump_data_version(*resources):
+    """Отметить ресурсы измененными (и сбросить зависящую от них статистику дашборда)"""
+    cache.delete(*_data_version_keys(resources))
+
+
+_CACHE_KEYS_AFTER_COMMIT = 'cache_keys_after_commit'
+
+
+def delete_after_commit(target, *keys):
+    """
+    Удалить ключи кэша после COMMIT транзакции, в которой изменился target.
+    Сброс во время flush позволил бы параллельному запросу до COMMIT снова
+    закэшировать старую строку.
+    """
+    session = inspect(target).session
+    if session is None:
+        cache.delete(*keys)
+        return
+    session.info.setdefault(_CACHE_KEYS_AFTER_COMMIT, set()).update(keys)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _delete_pending_cache_keys(session):
+    # После отката лишний сброс безвреден - следующее чтение просто перезагрузит запись
+    keys = session.info.pop(_CACHE_KEYS_AFTER_COMMIT, None)
+    if keys:
+        cache.delete(*keys)
+
+# Argon2id с базовыми параметрами OWASP (46 MiB, 2 прохода)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=46 * 1024, parallelism=1, hash_len=32)
+
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash():
+    return password_hasher.hash('dummy-password')
+
+
+def verify_dummy_password(password):
+    """
+    Проверка пароля по фиктивному хэшу: вход с несуществующим email
+    занимает столько же времени, сколько с существующим
+    """
+    try:
+        password_hasher.verify(_dummy_password_hash(), password)
+    except (VerificationError, InvalidHashError):
+        pass
+
+
+class utcnow(FunctionElement):
+    """Текущее время UTC на стороне БД (для created_at/updated_at)"""
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utcnow, 'sqlite')
+def _utcnow_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP в SQLite - с точностью до секунды, здесь - до миллисекунд
+    return "STRFTIME('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    # now() возвращается в часовом поясе сессии, колонки хранят наивное UTC
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+class casefold(FunctionElement):
+    """Строка без учета регистра (для сортировки и сравнения по названию)"""
+    type = db.String()
+    inherit_cache = True
+
+
+@compiles(casefold)
+def _casefold_default(element, compiler, **kw):
+    return f'LOWER({compiler.process(element.clauses, **kw)})'
+
+
+@compiles(casefold, 'sqlite')
+def _casefold_sqlite(element, compiler, **kw):
+    # LOWER() в SQLite меняет регистр только у ASCII, кириллица осталась бы как есть;
+    # py_casefold регистрируется при подключении в extensions.py
+    return f'PY_CASEFOLD({compiler.process(element.clauses, **kw)})'
+
+
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def _partitioned_primary_key(constraint, compiler, **kw):
+    """Первичный ключ секционированной таблицы обязан включать ключ секционирования"""
+    partition_key = constraint.table.info.get('partition_key')
+    if partition_key is None or partition_key in constraint.columns:
+        return compiler.visit_primary_key_constraint(constraint, **kw)
+    columns = [column.name for column in constraint.columns] + [partition_key]
+    return 'PRIMARY KEY (%s)' % ', '.join(compiler.preparer.quote(name) for name in columns)
+
+
+class CachedColumnsMixin:
+    """
+    Кэширование экземпляров по значениям колонок: в кэш попадает только словарь
+    колонок, экземпляр собирается из него и присоединяется к сессии без SELECT.
+    Связи при обращении загружаются обычным образом.
+    """
+    
+    def to_cache(self):
+        return {attr.key: getattr(self, attr.key) for attr in inspect(type(self)).column_attrs}
+    
+    @classmethod
+    def from_cache(cls, values):
+        instance = db.session.identity_map.get(db.session.identity_key(cls, values['id']))
+        if instance is not None:
+            return instance
+        instance = cls(**values)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
+
+
+class User(CachedColumnsMixin, db.Model):
     """Базовая модель пользователя с ролевой системой"""
     __tablename__ = 'user'
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(255), nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)  # Argon2id ~100 символов, PBKDF2 ~102
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20))
-    role = db.Column(db.String(20), nullable=False, default='user')  # 'user', 'event_creator', 'admin'
+    # В PostgreSQL - нативный ENUM, в остальных БД - VARCHAR с CHECK
+    role = db.Column(db.Enum(*USER_ROLES, name='user_role', create_constraint=True),
+                     nullable=False, default='user')
+    # Битовая маска ролей, синхронизируется с role; проверяется в SQL через has_role()
+    role_flags = db.Column(db.SmallInteger, nullable=False, default=ROLE_USER, server_default='1')
     is_active = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    
+    __table_args__ = (
+        # Списки пользователей в админ-панели: активные, новые сначала
+        db.Index('idx_user_active_created', 'is_active', 'created_at'),
+        db.Index('idx_user_active_role', 'is_active', 'role'),
+    )
+    
+    # Relationships
+    event_creator_profile = db.relationship('EventCreator', back_populates='user', uselist=False, lazy='joined')
+    profile = db.relationship('UserProfile', back_populates='user', uselist=False, lazy='joined')
+    favorites = db.relationship('Favorite', back_populates='user')
+    reviews = db.relationship('Review', back_populates='user')
+    notifications = db.relationship('Notification', back_populates='user')
+    
+    def __init__(self, **kwargs):
+        # default колонок применяется только при INSERT; без роли role_flags был бы None,
+        # и has_role() у еще не сохраненного пользователя падал бы с TypeError
+        kwargs.setdefault('role', 'user')
+        super().__init__(**kwargs)
+    
+    @validates('email')
+    def normalize_email(self, key, value):
+        """Email хранится в нижнем регистре, чтобы поиск использовал обычный индекс"""
+        return value.strip().lower() if value else value
+    
+    @validates('role')
+    def sync_role_flags(self, key, value):
+        """При смене роли обновить битовую маску"""
+        self.role_flags = ROLE_FLAGS.get(value, ROLE_USER)
+        return value
+    
+    @hybrid_method
+    def has_role(self, flag):
+        """Есть ли у пользователя роль (ROLE_USER / ROLE_EVENT_CREATOR / ROLE_ADMIN)"""
+        return (self.role_flags & flag) != 0
+    
+    @has_role.expression
+    def has_role(cls, flag):
+        return cls.role_flags.op('&')(flag) != 0
     
     def set_password(self, password):
-        """Установить хэш пароля"""
-        self.password_hash = generate_password_hash(password)
+        """Установить хэш пароля (Argon2id)"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Проверить пароль"""
-        return check_password_hash(self.password_hash, password)
+        """
+        Проверить пароль.
+        Хэши старого формата (werkzeug PBKDF2) и хэши с устаревшими параметрами
+        пересчитываются при успешной проверке; сохранение - при следующем commit.
+        """
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def is_admin(self):
         """Проверить, является ли пользователь администратором"""
-        return self.role == 'admin'
+        return self.has_role(ROLE_ADMIN)
     
     def is_event_creator(self):
         """Проверить, является ли пользователь создателем ивентов"""
-        return self.role == 'event_creator'
+        return self.has_role(ROLE_EVENT_CREATOR)
+    
+    @classmethod
+    def get_by_id(cls, user_id):
+        """
+        Получить пользователя по ID через кэш (USER_CACHE_ENABLED).
+        Кэш сбрасывается событиями after_update/after_delete.
+        """
+        if not current_app.config.get('USER_CACHE_ENABLED'):
+            return db.session.get(cls, user_id)
+        
+        values = cache.get(f'user:{user_id}')
+        if values is not None:
+            return cls.from_cache(values)
+        
+        user = db.session.get(cls, user_id)
+        if user is not None:
+            user._store_in_cache()
+        return user
+    
+    @classmethod
+    def get_by_email(cls, email):
+        """Получить пользователя по email; кэш email -> ID ведет на запись get_by_id"""
+        email = email.strip().lower()
+        if current_app.config.get('USER_CACHE_ENABLED'):
+            user_id = cache.get(f'user:email:{email}')
+            if user_id is not None:
+                user = cls.get_by_id(user_id)
+                if user is not None and user.email == email:
+                    return user
+        
+        user = db.session.execute(select(cls).where(cls.email == email)).scalar_one_or_none()
+        if user is not None and current_app.config.get('USER_CACHE_ENABLED'):
+            user._store_in_cache()
+        return user
+    
+    def to_cache(self):
+        # Хэш пароля в кэш не попадает: check_password загрузит его из БД
+        values = super().to_cache()
+        values.pop('password_hash', None)
+        return values
+    
+    def _store_in_cache(self):
+        cache.set(f'user:{self.id}', self.to_cache(), USER_CACHE_TIMEOUT)
+        cache.set(f'user:email:{self.email}', self.id, USER_CACHE_TIMEOUT)
     
     def __repr__(self):
         return f'<User {self.email}>'
 
-class EventCreator(db.Model):
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user_cache(mapper, connection, target):
+    keys = {f'user:{target.id}', f'user:email:{target.email}',
+            f'user:email:{_previous_value(target, "email")}'}
+    delete_after_commit(target, *keys, *_data_version_keys(['users']))
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    delete_after_commit(target, *_data_version_keys(['users']))
+
+class EventCreator(CachedColumnsMixin, db.Model):
     """Модель создателя ивентов (расширение пользователя)"""
     __tablename__ = 'event_creator'
     
@@ -43,16 +335,35 @@ class EventCreator(db.Model):
     company_name = db.Column(db.String(200))
     description = db.Column(db.Text)
     verified = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     
     # Relationships
-    user = db.relationship('User', backref=db.backref('event_creator_profile', uselist=False))
-    masterclasses = db.relationship('Masterclass', backref='creator', cascade='all, delete-orphan', lazy='dynamic')
+    user = db.relationship('User', back_populates='event_creator_profile', lazy='joined')
+    masterclasses = db.relationship('Masterclass', back_populates='creator', cascade='all, delete-orphan')
+    
+    @classmethod
+    def get_by_user_id(cls, user_id):
+        """
+        Получить профиль создателя по ID пользователя через кэш (USER_CACHE_ENABLED,
+        по умолчанию включен только с Redis). Кэш сбрасывается после COMMIT изменений.
+        """
+        query = select(cls).where(cls.user_id == user_id)
+        if not current_app.config.get('USER_CACHE_ENABLED'):
+            return db.session.execute(query).unique().scalar_one_or_none()
+        
+        values = cache.get(f'creator:user:{user_id}')
+        if values is not None:
+            return cls.from_cache(values)
+        
+        creator = db.session.execute(query).unique().scalar_one_or_none()
+        if creator is not None:
+            cache.set(f'creator:user:{user_id}', creator.to_cache(), USER_CACHE_TIMEOUT)
+        return creator
     
     def __repr__(self):
         return f'<EventCreator {self.company_name or self.user.name}>'
 
-class Masterclass(db.Model):
+class Masterclass(CachedColumnsMixin, db.Model):
     """Модель мастер-класса с привязкой к создателю"""
     __tablename__ = 'masterclass'
     
@@ -66,31 +377,105 @@ class Masterclass(db.Model):
     price = db.Column(db.Numeric(10, 2))
     category = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Сумма и количество одобренных оценок - поддерживаются событиями Review
+    rating_sum = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    rating_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow(), nullable=False)
     
     # Relationships
-    registrations = db.relationship('Registration', backref='masterclass', cascade='all, delete-orphan', lazy='dynamic')
+    # Коллекция загружается при первом обращении и кэшируется в identity map;
+    # для пакетной обработки - selectinload(Masterclass.registrations),
+    # для постраничного вывода - Masterclass.registrations_page()
+    registrations = db.relationship('Registration', back_populates='masterclass', cascade='all, delete-orphan')
+    creator = db.relationship('EventCreator', back_populates='masterclasses', lazy='joined')
+    # Только для чтения: отзывы и избранное изменяются через свои модели
+    reviews = db.relationship('Review', back_populates='masterclass', viewonly=True, lazy='selectin')
+    favorited_by = db.relationship('Favorite', back_populates='masterclass', viewonly=True, lazy='selectin')
+    
+    __table_args__ = (
+        db.CheckConstraint('current_participants <= max_participants', name='capacity_ok'),
+        db.CheckConstraint('max_participants > 0', name='capacity_positive'),
+        # Индексы под списки: активные предстоящие, по категории, по создателю, новые в админ-панели
+        db.Index('idx_mc_active_date', 'is_active', 'date_time'),
+        db.Index('idx_mc_cat_active_date', 'category', 'is_active', 'date_time'),
+        db.Index('idx_mc_creator_active_date', 'creator_id', 'is_active', 'date_time'),
+        db.Index('idx_mc_active_created', 'is_active', 'created_at'),
+    )
     
-    @property
+    # Свойства доступны и на экземпляре, и в запросах:
+    # Masterclass.query.filter(Masterclass.can_register())
+    @hybrid_property
     def available_spots(self):
         """Количество доступных мест"""
         return self.max_participants - self.current_participants
     
-    @property
+    @hybrid_property
     def is_full(self):
         """Проверить, заполнен ли мастер-класс"""
         return self.current_participants >= self.max_participants
     
-    @property
+    @hybrid_property
     def is_upcoming(self):
         """Проверить, предстоящий ли мастер-класс"""
         return self.date_time > datetime.utcnow()
     
+    @hybrid_property
+    def avg_rating(self):
+        """Средний рейтинг по одобренным отзывам (None, если оценок нет)"""
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+    
+    @avg_rating.expression
+    def avg_rating(cls):
+        return db.cast(cls.rating_sum, db.Float) / func.nullif(cls.rating_count, 0)
+    
+    @hybrid_method
     def can_register(self):
         """Можно ли зарегистрироваться на мастер-класс"""
         return self.is_active and not self.is_full and self.is_upcoming
     
+    @can_register.expression
+    def can_register(cls):
+        return and_(cls.is_active.is_(True), ~cls.is_full, cls.is_upcoming)
+    
+    @classmethod
+    def registrations_page(cls, masterclass_id, offset=0, limit=20):
+        """Страница регистраций мастер-класса (новые первыми)"""
+        return db.session.execute(
+            select(Registration)
+            .where(Registration.masterclass_id == masterclass_id)
+            .order_by(Registration.registered_at.desc(), Registration.id.desc())
+            .offset(offset)
+            .limit(limit)
+        ).scalars().all()
+    
+    @classmethod
+    def try_register(cls, masterclass_id):
+        """
+        Атомарно занять место: UPDATE ... SET current_participants = current_participants + 1
+        с проверкой вместимости в WHERE. Возвращает False, если мест нет.
+        Изменение фиксируется вместе с текущей транзакцией.
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == masterclass_id, cls.current_participants < cls.max_participants)
+            .values(current_participants=cls.current_participants + 1)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+    
+    @classmethod
+    def release_spot(cls, masterclass_id):
+        """Атомарно освободить место (симметрично try_register)"""
+        db.session.execute(
+            update(cls)
+            .where(cls.id == masterclass_id, cls.current_participants > 0)
+            .values(current_participants=cls.current_participants - 1)
+            .execution_options(synchronize_session=False)
+        )
+    
     def can_cancel_registration(self):
         """Можно ли отменить регистрацию (более 24 часов до начала)"""
         if not self.is_upcoming:
@@ -101,6 +486,49 @@ class Masterclass(db.Model):
     def __repr__(self):
         return f'<Masterclass {self.title}>'
 
+def available_masterclasses_cache_key(category=None):
+    """Ключ кэша списка доступных мастер-классов (все или одна категория)"""
+    return f'mc_avail:{category or "*"}'
+
+# Версия кэша автодополнения: удаление ключа делает устаревшими все закэшированные подсказки
+AUTOCOMPLETE_VERSION_KEY = 'autocomplete:version'
+
+# Популярные категории (GROUP BY по всем мастер-классам) меняются медленно
+POPULAR_CATEGORIES_CACHE_KEY = 'popular_categories'
+POPULAR_CATEGORIES_CACHE_TIMEOUT = 600
+
+def masterclass_cards_cache_key(category=None):
+    """Ключ фрагмента карточек на главной ({% cache ..., 'mc_cards', category %} в index.html)"""
+    return fragment_cache_key('mc_cards', category or '*')
+
+@event.listens_for(Masterclass, 'after_insert')
+@event.listens_for(Masterclass, 'after_update')
+@event.listens_for(Masterclass, 'after_delete')
+def _invalidate_available_masterclasses(mapper, connection, target):
+    delete_after_commit(target, *_masterclass_cache_keys(
+        [target.category, _previous_value(target, 'category')]))
+
+def _masterclass_cache_keys(categories):
+    """Ключи кэшей каталога для указанных категорий (и общего списка) и версия 'masterclasses'"""
+    categories = {None, *categories}
+    keys = [available_masterclasses_cache_key(category) for category in categories]
+    keys += [masterclass_cards_cache_key(category) for category in categories]
+    return [AUTOCOMPLETE_VERSION_KEY, POPULAR_CATEGORIES_CACHE_KEY, *keys,
+            *_data_version_keys(['masterclasses'])]
+
+def invalidate_masterclass_caches(*categories):
+    """
+    Сбросить кэши каталога для указанных категорий (и общего списка).
+    События ORM сбрасывают их после COMMIT сами; массовые UPDATE в обход ORM
+    вызывают эту функцию явно, после своего COMMIT.
+    """
+    cache.delete(*_masterclass_cache_keys(categories))
+
+def invalidate_user_cache(user_id):
+    """Сбросить кэш пользователя по ID (после UPDATE в обход ORM)"""
+    cache.delete(f'user:{user_id}')
+    bump_data_version('users')
+
 class Registration(db.Model):
     """Модель регистрации с ограничениями уникальности"""
     __tablename__ = 'registration'
@@ -110,18 +538,45 @@ class Registration(db.Model):
     user_name = db.Column(db.String(100), nullable=False)
     user_email = db.Column(db.String(100), nullable=False)
     user_phone = db.Column(db.String(20))
-    registered_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    registered_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    # Напоминание участнику отправлено (send_reminders.py не отправляет его повторно);
+    # сбрасывается при переносе мастер-класса на другое время
+    reminder_sent = db.Column(db.Boolean, default=False, server_default=false(), nullable=False)
     
     # Ограничение уникальности: один email на один мастер-класс
     __table_args__ = (
         db.UniqueConstraint('masterclass_id', 'user_email', name='unique_registration_per_masterclass'),
         db.Index('idx_registration_email', 'user_email'),
         db.Index('idx_registration_masterclass', 'masterclass_id'),
+        # В PostgreSQL - hash-секции по мастер-классу, у каждой свои индексы
+        {'postgresql_partition_by': 'HASH (masterclass_id)', 'info': {'partition_key': 'masterclass_id'}},
     )
     
+    @validates('user_email')
+    def normalize_user_email(self, key, value):
+        """Email хранится в нижнем регистре, чтобы поиск использовал обычный индекс"""
+        return value.strip().lower() if value else value
+    
+    # Relationships
+    masterclass = db.relationship('Masterclass', back_populates='registrations')
+    
     def __repr__(self):
         return f'<Registration {self.user_email} -> {self.masterclass.title}>'
 
+for _remainder in range(REGISTRATION_PARTITIONS):
+    event.listen(Registration.__table__, 'after_create', DDL(
+        f'CREATE TABLE registration_p{_remainder} PARTITION OF registration '
+        f'FOR VALUES WITH (MODULUS {REGISTRATION_PARTITIONS}, REMAINDER {_remainder})'
+    ).execute_if(dialect='postgresql'))
+
+@event.listens_for(Registration, 'after_insert')
+@event.listens_for(Registration, 'after_delete')
+def _registration_changed(mapper, connection, target):
+    # Число участников входит в аналитику создателей и статистику админ-панели;
+    # версия меняется после COMMIT, иначе параллельный запрос закэширует под новой
+    # версией еще не зафиксированные данные
+    delete_after_commit(target, *_data_version_keys(['registrations']))
+
 # Дополнительные модели для расширенной функциональности
 
 class UserProfile(db.Model):
@@ -131,14 +586,20 @@ class UserProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     bio = db.Column(db.Text)
-    interests = db.Column(db.Text)  # JSON строка с интересами
+    interests = db.Column(JSONType, nullable=False, server_default='{}')  # интересы и поисковые предпочтения
     avatar_url = db.Column(db.String(255))
-    notification_preferences = db.Column(db.Text)  # JSON настройки уведомлений
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    notification_preferences = db.Column(JSONType, nullable=False, server_default='{}')  # настройки уведомлений
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow(), nullable=False)
+    
+    __table_args__ = (
+        # GIN-индекс для запросов по содержимому (@>) - только в PostgreSQL
+        db.Index('idx_profile_notifs_gin', 'notification_preferences',
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
     
     # Relationships
-    user = db.relationship('User', backref=db.backref('profile', uselist=False))
+    user = db.relationship('User', back_populates='profile')
     
     def __repr__(self):
         return f'<UserProfile {self.user.name}>'
@@ -150,7 +611,7 @@ class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     masterclass_id = db.Column(db.Integer, db.ForeignKey('masterclass.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     
     # Ограничение уникальности
     __table_args__ = (
@@ -158,8 +619,8 @@ class Favorite(db.Model):
     )
     
     # Relationships
-    user = db.relationship('User', backref='favorites')
-    masterclass = db.relationship('Masterclass', backref='favorited_by')
+    user = db.relationship('User', back_populates='favorites')
+    masterclass = db.relationship('Masterclass', back_populates='favorited_by')
     
     def __repr__(self):
         return f'<Favorite {self.user.name} -> {self.masterclass.title}>'
@@ -174,7 +635,7 @@ class Review(db.Model):
     rating = db.Column(db.Integer, nullable=False)  # 1-5 звезд
     comment = db.Column(db.Text)
     is_approved = db.Column(db.Boolean, default=True, nullable=False)  # Для модерации
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     
     # Ограничение уникальности: один отзыв от пользователя на мастер-класс
     __table_args__ = (
@@ -183,12 +644,81 @@ class Review(db.Model):
     )
     
     # Relationships
-    user = db.relationship('User', backref='reviews')
-    masterclass = db.relationship('Masterclass', backref='reviews')
+    user = db.relationship('User', back_populates='reviews')
+    masterclass = db.relationship('Masterclass', back_populates='reviews')
     
     def __repr__(self):
         return f'<Review {self.user.name} -> {self.masterclass.title} ({self.rating}★)>'
 
+def _apply_rating_delta(connection, target, masterclass_id, rating_delta, count_delta):
+    """Сдвинуть счетчики рейтинга мастер-класса в той же транзакции"""
+    if not masterclass_id or (not rating_delta and not count_delta):
+        return
+    connection.execute(
+        update(Masterclass.__table__)
+        .where(Masterclass.__table__.c.id == masterclass_id)
+        .values(rating_sum=Masterclass.__table__.c.rating_sum + rating_delta,
+                rating_count=Masterclass.__table__.c.rating_count + count_delta)
+    )
+    # Загруженный в сессию мастер-класс перечитает счетчики при следующем обращении
+    state = inspect(target)
+    if state.session is not None:
+        masterclass = state.session.identity_map.get(
+            state.session.identity_key(Masterclass, masterclass_id))
+        if masterclass is not None:
+            state.session.expire(masterclass, ['rating_sum', 'rating_count'])
+
+def _previous_value(target, key):
+    """Значение атрибута до изменения в текущем flush"""
+    history = inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, key)
+
+@event.listens_for(Review, 'after_insert')
+@event.listens_for(Review, 'after_update')
+@event.listens_for(Review, 'after_delete')
+def _review_changed(mapper, connection, target):
+    # После COMMIT: ETag админ-панели не должен совпасть со старыми данными
+    delete_after_commit(target, *_data_version_keys(['reviews']))
+
+@event.listens_for(Masterclass, 'before_delete')
+def _delete_masterclass_children(mapper, connection, target):
+    # reviews и favorited_by - viewonly, ORM их не каскадирует; без этого удаление
+    # мастер-класса (в том числе каскадом от создателя) оставит строки-сироты
+    connection.execute(delete(Review.__table__).where(Review.__table__.c.masterclass_id == target.id))
+    connection.execute(delete(Favorite.__table__).where(Favorite.__table__.c.masterclass_id == target.id))
+    delete_after_commit(target, *_data_version_keys(['reviews']))
+
+@event.listens_for(EventCreator, 'after_insert')
+@event.listens_for(EventCreator, 'after_update')
+@event.listens_for(EventCreator, 'after_delete')
+def _creator_changed(mapper, connection, target):
+    # Профиль создателя показывается в списках пользователей и мастер-классов
+    delete_after_commit(target, f'creator:user:{target.user_id}',
+                        f'creator:user:{_previous_value(target, "user_id")}',
+                        *_data_version_keys(['users']))
+
+@event.listens_for(Review, 'after_insert')
+def _review_inserted(mapper, connection, target):
+    if target.is_approved:
+        _apply_rating_delta(connection, target, target.masterclass_id, target.rating, 1)
+
+@event.listens_for(Review, 'after_update')
+def _review_updated(mapper, connection, target):
+    old_masterclass_id = _previous_value(target, 'masterclass_id')
+    if _previous_value(target, 'is_approved'):
+        _apply_rating_delta(connection, target, old_masterclass_id,
+                            -_previous_value(target, 'rating'), -1)
+    if target.is_approved:
+        _apply_rating_delta(connection, target, target.masterclass_id, target.rating, 1)
+
+@event.listens_for(Review, 'after_delete')
+def _review_deleted(mapper, connection, target):
+    if _previous_value(target, 'is_approved'):
+        _apply_rating_delta(connection, target, _previous_value(target, 'masterclass_id'),
+                            -_previous_value(target, 'rating'), -1)
+
 class Notification(db.Model):
     """Системные уведомления"""
     __tablename__ = 'notification'
@@ -199,10 +729,97 @@ class Notification(db.Model):
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_notif_user_unread', 'user_id', 'is_read', 'created_at'),
+        # Частичный индекс только по непрочитанным - под счетчик и список непрочитанных
+        db.Index('idx_notif_unread', 'user_id', 'created_at',
+                 postgresql_where=db.text('NOT is_read'), sqlite_where=db.text('NOT is_read')),
+        # BRIN по времени создания для очистки старых уведомлений - только в PostgreSQL
+        db.Index('idx_notif_created_brin', 'created_at',
+                 postgresql_using='brin').ddl_if(dialect='postgresql'),
+    )
     
     # Relationships
-    user = db.relationship('User', backref='notifications')
+    user = db.relationship('User', back_populates='notifications')
+    
+    @classmethod
+    def fan_out(cls, user_ids, notification_type, title, message):
+        """
+        Создать одинаковое уведомление для нескольких пользователей одним INSERT,
+        минуя unit of work. Изменение фиксируется вместе с текущей транзакцией.
+        """
+        rows = [
+            {'user_id': user_id, 'type': notification_type, 'title': title,
+             'message': message, 'is_read': False}
+            for user_id in user_ids
+        ]
+        if rows:
+            db.session.execute(insert(cls), rows)
+        return len(rows)
+    
+    def __repr__(self):
+        return f'<Notification {self.type} -> {self.user.name}>'
+
+# Популярные мастер-классы: в PostgreSQL - материализованное представление
+# (обновляется MasterclassService.refresh_popular_masterclasses), в остальных БД - обычное
+_POPULAR_MASTERCLASSES_SELECT = """
+SELECT m.id, m.title, m.category, m.date_time,
+       m.current_participants AS participants,
+       COUNT(f.id) AS favorites,
+       m.rating_sum, m.rating_count
+FROM masterclass m
+LEFT JOIN favorite f ON f.masterclass_id = m.id
+WHERE m.is_active
+GROUP BY m.id
+"""
+
+event.listen(db.metadata, 'after_create', DDL(
+    'CREATE MATERIALIZED VIEW IF NOT EXISTS popular_masterclasses AS' + _POPULAR_MASTERCLASSES_SELECT
+).execute_if(dialect='postgresql'))
+# Уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+event.listen(db.metadata, 'after_create', DDL(
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_popular_mc_id ON popular_masterclasses (id)'
+).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'after_create', DDL(
+    'CREATE VIEW IF NOT EXISTS popular_masterclasses AS' + _POPULAR_MASTERCLASSES_SELECT
+).execute_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != 'postgresql'))
+event.listen(db.metadata, 'before_drop', DDL(
+    'DROP MATERIALIZED VIEW IF EXISTS popular_masterclasses'
+).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop', DDL(
+    'DROP VIEW IF EXISTS popular_masterclasses'
+).execute_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != 'postgresql'))
+
+# Представление не входит в db.metadata, чтобы create_all не создавал его как таблицу
+_views_metadata = db.MetaData()
+
+class PopularMasterclass(db.Model):
+    """Популярность мастер-класса (только чтение, из представления popular_masterclasses)"""
+    __table__ = db.Table(
+        'popular_masterclasses', _views_metadata,
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('title', db.String(200)),
+        db.Column('category', db.String(100)),
+        db.Column('date_time', db.DateTime),
+        db.Column('participants', db.Integer),
+        db.Column('favorites', db.Integer),
+        db.Column('rating_sum', db.Integer),
+        db.Column('rating_count', db.Integer),
+    )
+    
+    @hybrid_property
+    def score(self):
+        """Участники и добавления в избранное"""
+        return self.participants + self.favorites
+    
+    @hybrid_property
+    def avg_rating(self):
+        """Средний рейтинг (None, если оценок нет)"""
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
     
     def __repr__(self):
-        return f'<Notification {self.type} -> {self.user.name}>'
\ No newline at end of file
+        return f'<PopularMasterclass {self.title} ({self.score})>'
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Скрипт для очистки старых прочитанных уведомлений
+
+Удаляет прочитанные уведомления старше 30 дней, чтобы таблица notification
+не росла бесконечно. Запускать раз в сутки через cron.
+
+Пример использования в crontab:
+30 3 * * * cd /path/to/app && /path/to/venv/bin/python prune_notifications.py
+"""
+
+import sys
+import logging
+from app import create_app
+from extensions import db
+from services import NotificationService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+def prune_notifications():
+    """Удалить старые прочитанные уведомления"""
+    app = create_app()
+    with app.app_context():
+        try:
+            return NotificationService.prune_read_notifications()
+        finally:
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    prune_notifications()
+    sys.exit(0)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Скрипт для обновления представления популярных мастер-классов
+
+В PostgreSQL popular_masterclasses - материализованное представление,
+его нужно периодически пересчитывать (например, каждые 5 минут через cron).
+В остальных БД представление обычное, скрипт ничего не делает.
+
+Пример использования в crontab:
+*/5 * * * * cd /path/to/app && /path/to/venv/bin/python refresh_popular.py
+"""
+
+import sys
+import logging
+from app import create_app
+from services import MasterclassService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+def refresh_popular():
+    """Обновить представление популярных мастер-классов"""
+    app = create_app()
+    with app.app_context():
+        return MasterclassService.refresh_popular_masterclasses()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if refresh_popular() else 1)
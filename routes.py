@@ -2,22 +2,66 @@
 Маршруты для веб-портала регистрации на мастер-классы
 Требования: 1.1, 1.2, 1.3, 2.1, 2.2, 3.1, 3.2, 1.4, 2.3, 3.4, 5.4
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from forms import RegistrationForm, SearchForm, CancelRegistrationForm, AdvancedSearchForm, ReviewForm
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g
+from forms import (
+    RegistrationForm, SearchForm, CancelRegistrationForm, AdvancedSearchForm, ReviewForm,
+    CATEGORY_CHOICES, CATEGORY_KEYS, parse_iso_datetime
+)
 from services import MasterclassService, RegistrationService, ReviewService, SearchService
 from models import Masterclass
 from error_handlers import (
     MasterclassFullError, DuplicateRegistrationError, TimeConstraintError,
     CancellationTooLateError, DatabaseConnectionError, DataValidationError
 )
-from datetime import datetime
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 # Публичный blueprint
 public_bp = Blueprint('public', __name__)
 
+# Рейтинг мастер-класса без оценок (в формате ReviewService.get_ratings_for)
+_NO_RATING = {'rating': None, 'count': 0}
+
+
+def _opt_date(value):
+    """Дата 'ГГГГ-ММ-ДД' из параметра запроса или None"""
+    return parse_iso_datetime(value, '%Y-%m-%d') if value else None
+
+
+def _opt_float(value):
+    """
+    Число из параметра запроса или None (без исключений на пустых и некорректных строках).
+    Принимает все, что разбирает float(), и десятичную запятую ('4,5'); nan/inf - None
+    """
+    if not value:
+        return None
+    try:
+        number = float(value.strip().replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _user_id():
+    """ID пользователя из сессии, прочитанный один раз за запрос"""
+    if 'uid' not in g:
+        g.uid = session.get('user_id')
+    return g.uid
+
+
+def _search_preferences(user_id):
+    """
+    Поисковые предпочтения из сессии; из БД - только при первом обращении
+    (или после входа под другим пользователем)
+    """
+    stored = session.get('search_prefs')
+    if stored is None or stored.get('user_id') != user_id:
+        stored = {'user_id': user_id, 'prefs': SearchService.get_search_preferences(user_id)}
+        session['search_prefs'] = stored
+    return stored['prefs']
+
 
 @public_bp.route('/')
 @public_bp.route('/index')
@@ -27,44 +71,31 @@ def index():
     Требования: 1.1, 1.2, 1.3, 5.4, 10.4
     """
     try:
-        # Получить параметры фильтрации из URL
+        # Получить параметры фильтрации из URL; неизвестная категория - без фильтра
         category = request.args.get('category', None)
+        if category and category not in CATEGORY_KEYS:
+            category = None
         
         # Получить доступные мастер-классы с обработкой ошибок БД - Требование: 5.4
+        db_error = False
         try:
-            masterclasses = MasterclassService.get_available_masterclasses(category=category)
+            masterclasses = MasterclassService.get_available_masterclasses_cached(category=category)
         except DatabaseConnectionError as e:
             logger.error(f"Database error fetching masterclasses: {e}")
             flash('Временные проблемы с базой данных. Показаны кэшированные данные', 'warning')
             masterclasses = []
+            db_error = True
         
-        # Добавить рейтинги к мастер-классам - Требование: 10.4
-        masterclass_ratings = {}
-        for mc in masterclasses:
-            rating = ReviewService.get_masterclass_average_rating(mc.id)
-            count = ReviewService.get_masterclass_review_count(mc.id)
-            masterclass_ratings[mc.id] = {'rating': rating, 'count': count}
-        
-        # Получить список категорий для фильтра
-        categories = [
-            ('programming', 'Программирование'),
-            ('design', 'Дизайн'),
-            ('business', 'Бизнес'),
-            ('marketing', 'Маркетинг'),
-            ('art', 'Искусство'),
-            ('music', 'Музыка'),
-            ('cooking', 'Кулинария'),
-            ('photography', 'Фотография'),
-            ('fitness', 'Фитнес'),
-            ('other', 'Другое')
-        ]
+        # Рейтинги из колонок загруженных мастер-классов - Требование: 10.4
+        masterclass_ratings = ReviewService.get_ratings_for(masterclasses)
         
         return render_template(
             'public/index.html',
             masterclasses=masterclasses,
-            categories=categories,
+            categories=CATEGORY_CHOICES,
             selected_category=category,
-            masterclass_ratings=masterclass_ratings
+            masterclass_ratings=masterclass_ratings,
+            db_error=db_error
         )
     
     except Exception as e:
@@ -76,7 +107,8 @@ def index():
             masterclasses=[],
             categories=[],
             selected_category=None,
-            masterclass_ratings={}
+            masterclass_ratings={},
+            db_error=True
         )
 
 
@@ -96,12 +128,11 @@ def masterclass_detail(masterclass_id):
     form = RegistrationForm()
     
     # Получить рейтинг и отзывы
-    average_rating = ReviewService.get_masterclass_average_rating(masterclass_id)
-    review_count = ReviewService.get_masterclass_review_count(masterclass_id)
-    recent_reviews = ReviewService.get_masterclass_reviews(masterclass_id)[:3]  # Последние 3 отзыва
+    average_rating, review_count = ReviewService.get_rating_summary(masterclass_id)
+    recent_reviews = ReviewService.get_recent_reviews(masterclass_id, limit=3)
     
     # Проверить, может ли текущий пользователь оставить отзыв
-    user_id = session.get('user_id')
+    user_id = _user_id()
     can_review = False
     if user_id:
         can_review = ReviewService.can_user_review(user_id, masterclass_id)
@@ -207,18 +238,22 @@ def my_registrations():
     """
     form = SearchForm()
     registrations = []
+    pagination = None
     
     if form.validate_on_submit():
-        # Получить регистрации пользователя
-        registrations = RegistrationService.get_user_registrations(form.email.data)
+        # Получить страницу регистраций пользователя
+        page = max(request.form.get('page', 1, type=int), 1)
+        pagination = RegistrationService.get_user_registrations_page(form.email.data, page=page)
+        registrations = pagination.items
         
-        if not registrations:
+        if not pagination.total:
             flash('Регистрации не найдены для указанного email', 'info')
     
     return render_template(
         'public/my_registrations.html',
         form=form,
-        registrations=registrations
+        registrations=registrations,
+        pagination=pagination
     )
 
 
@@ -299,13 +334,15 @@ def search():
     # Проверяем, является ли запрос AJAX
     is_ajax = request.args.get('ajax') == '1' or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     
-    form = AdvancedSearchForm(request.args)
     masterclasses = []
     masterclass_ratings = {}
+    has_more = False
     
     # Получить параметры поиска из URL
     query = request.args.get('query', '').strip()
     category = request.args.get('category', '').strip()
+    if category not in CATEGORY_KEYS:
+        category = ''
     date_from = request.args.get('date_from', '').strip()
     date_to = request.args.get('date_to', '').strip()
     price_min = request.args.get('price_min', '').strip()
@@ -313,44 +350,30 @@ def search():
     min_rating = request.args.get('min_rating', '').strip()
     sort_by = request.args.get('sort_by', 'date')
     sort_order = request.args.get('sort_order', 'asc')
-    page = int(request.args.get('page', 1))
+    page = max(request.args.get('page', 1, type=int), 1)
     per_page = 12
     
     # Загрузить сохраненные предпочтения пользователя - Требование: 8.5
-    user_id = session.get('user_id')
+    user_id = _user_id()
     saved_preferences = None
     if user_id:
-        saved_preferences = SearchService.get_search_preferences(user_id)
+        saved_preferences = _search_preferences(user_id)
     
-    if request.args:
+    # Параметры, которые действительно сужают выборку (page/ajax/sort_* - нет)
+    has_filters = any((query, category, date_from, date_to, price_min, price_max, min_rating))
+    date_from_obj = date_to_obj = price_min_val = price_max_val = min_rating_val = None
+    
+    if has_filters:
         # Преобразовать параметры
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
-        except:
-            date_from_obj = None
-        
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
-        except:
-            date_to_obj = None
-        
-        try:
-            price_min_val = float(price_min) if price_min else None
-        except:
-            price_min_val = None
-        
-        try:
-            price_max_val = float(price_max) if price_max else None
-        except:
-            price_max_val = None
-        
-        try:
-            min_rating_val = float(min_rating) if min_rating else None
-        except:
-            min_rating_val = None
-        
+        date_from_obj = _opt_date(date_from)
+        date_to_obj = _opt_date(date_to)
+        price_min_val = _opt_float(price_min)
+        price_max_val = _opt_float(price_max)
+        min_rating_val = _opt_float(min_rating)
+    
+    if has_filters or (request.args and (sort_by, sort_order) != ('date', 'asc')):
         # Выполнить поиск с использованием SearchService - Требования: 8.1, 8.2, 8.3, 8.4
-        all_masterclasses = SearchService.search_masterclasses(
+        masterclasses = SearchService.search_masterclasses(
             query=query if query else None,
             category=category if category else None,
             date_from=date_from_obj,
@@ -359,14 +382,21 @@ def search():
             price_max=price_max_val,
             min_rating=min_rating_val,
             sort_by=sort_by,
-            sort_order=sort_order
+            sort_order=sort_order,
+            # Пагинация для бесконечной прокрутки: лишняя строка - признак следующей страницы
+            limit=per_page + 1,
+            offset=(page - 1) * per_page
         )
-        
-        # Пагинация для бесконечной прокрутки
+        has_more = len(masterclasses) > per_page
+        masterclasses = masterclasses[:per_page]
+    elif request.args:
+        # Без фильтров и с сортировкой по дате - это каталог предстоящих из кэша
+        available = MasterclassService.get_available_masterclasses_cached()
         start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        masterclasses = all_masterclasses[start_idx:end_idx]
-        
+        masterclasses = available[start_idx:start_idx + per_page]
+        has_more = len(available) > start_idx + per_page
+    
+    if request.args:
         # Сохранить поисковые предпочтения - Требование: 8.5
         if user_id and request.args.get('save_preferences') == '1':
             preferences = {
@@ -377,21 +407,19 @@ def search():
                 'sort_by': sort_by,
                 'sort_order': sort_order
             }
-            SearchService.save_search_preferences(user_id, preferences)
+            if SearchService.save_search_preferences(user_id, preferences):
+                session['search_prefs'] = {'user_id': user_id, 'prefs': preferences}
             if not is_ajax:
                 flash('Поисковые предпочтения сохранены', 'success')
         
-        # Получить рейтинги для результатов
-        for mc in masterclasses:
-            rating = ReviewService.get_masterclass_average_rating(mc.id)
-            count = ReviewService.get_masterclass_review_count(mc.id)
-            masterclass_ratings[mc.id] = {'rating': rating, 'count': count}
+        # Рейтинги из колонок загруженных результатов, без дополнительных запросов
+        masterclass_ratings = ReviewService.get_ratings_for(masterclasses)
     
     # Если это AJAX запрос, вернуть JSON
     if is_ajax:
-        masterclasses_data = []
-        for mc in masterclasses:
-            mc_data = {
+        rating_of = masterclass_ratings.get
+        masterclasses_data = [
+            {
                 'id': mc.id,
                 'title': mc.title,
                 'description': mc.description,
@@ -400,17 +428,21 @@ def search():
                 'price': float(mc.price) if mc.price else None,
                 'max_participants': mc.max_participants,
                 'current_participants': mc.current_participants,
-                'rating': masterclass_ratings.get(mc.id, {}).get('rating'),
-                'review_count': masterclass_ratings.get(mc.id, {}).get('count', 0)
+                'rating': (rating := rating_of(mc.id, _NO_RATING))['rating'],
+                'review_count': rating['count']
             }
-            masterclasses_data.append(mc_data)
+            for mc in masterclasses
+        ]
         
         return jsonify({
             'masterclasses': masterclasses_data,
             'page': page,
-            'has_more': len(all_masterclasses) > end_idx
+            'has_more': has_more
         })
     
+    # Форма нужна только для HTML-страницы: AJAX-ответ обходится без нее
+    form = AdvancedSearchForm(request.args)
+    
     # Получить популярные категории
     popular_categories = SearchService.get_popular_categories()
     
@@ -438,17 +470,18 @@ def masterclass_reviews(masterclass_id):
         flash('Мастер-класс не найден', 'error')
         return redirect(url_for('public.index'))
     
-    # Получить отзывы
-    reviews = ReviewService.get_masterclass_reviews(masterclass_id)
+    # Получить страницу отзывов
+    page = max(request.args.get('page', 1, type=int), 1)
+    pagination = ReviewService.get_masterclass_reviews_page(masterclass_id, page=page)
     
     # Получить средний рейтинг
-    average_rating = ReviewService.get_masterclass_average_rating(masterclass_id)
-    review_count = ReviewService.get_masterclass_review_count(masterclass_id)
+    average_rating, review_count = ReviewService.get_rating_summary(masterclass_id)
     
     return render_template(
         'public/reviews.html',
         masterclass=masterclass,
-        reviews=reviews,
+        reviews=pagination.items,
+        pagination=pagination,
         average_rating=average_rating,
         review_count=review_count
     )
@@ -461,7 +494,7 @@ def add_review(masterclass_id):
     Требования: 10.4
     """
     # Проверить, что пользователь авторизован (используем session для простоты)
-    user_id = session.get('user_id')
+    user_id = _user_id()
     if not user_id:
         flash('Для добавления отзыва необходимо войти в систему', 'warning')
         return redirect(url_for('public.masterclass_detail', masterclass_id=masterclass_id))
@@ -518,153 +551,13 @@ def autocomplete():
     """
     from flask import jsonify
     
-    query = request.args.get('q', '').strip()
-    
-    if len(query) < 2:
-        return jsonify({'suggestions': []})
+    # Запрос нормализуется в get_autocomplete_suggestions_cached (он же ключ кэша)
+    query = request.args.get('q', '')
     
     try:
         # Получить предложения из названий мастер-классов
-        suggestions = SearchService.get_autocomplete_suggestions(query)
+        suggestions = SearchService.get_autocomplete_suggestions_cached(query)
         return jsonify({'suggestions': suggestions})
     except Exception as e:
         logger.error(f"Autocomplete error: {e}")
         return jsonify({'suggestions': []})
-
-
-@public_bp.route('/search', methods=['GET'])
-def search_with_ajax():
-    """
-    Расширенный поиск с поддержкой AJAX
-    Требования: 8.1, 8.2, 8.3, 8.4, 8.5
-    """
-    from flask import jsonify
-    
-    # Проверяем, является ли запрос AJAX
-    is_ajax = request.args.get('ajax') == '1' or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
-    
-    form = AdvancedSearchForm(request.args)
-    masterclasses = []
-    masterclass_ratings = {}
-    
-    # Получить параметры поиска из URL
-    query = request.args.get('query', '').strip()
-    category = request.args.get('category', '').strip()
-    date_from = request.args.get('date_from', '').strip()
-    date_to = request.args.get('date_to', '').strip()
-    price_min = request.args.get('price_min', '').strip()
-    price_max = request.args.get('price_max', '').strip()
-    min_rating = request.args.get('min_rating', '').strip()
-    sort_by = request.args.get('sort_by', 'date')
-    sort_order = request.args.get('sort_order', 'asc')
-    page = int(request.args.get('page', 1))
-    per_page = 12
-    
-    # Загрузить сохраненные предпочтения пользователя - Требование: 8.5
-    user_id = session.get('user_id')
-    saved_preferences = None
-    if user_id:
-        saved_preferences = SearchService.get_search_preferences(user_id)
-    
-    if request.args:
-        # Преобразовать параметры
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
-        except:
-            date_from_obj = None
-        
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
-        except:
-            date_to_obj = None
-        
-        try:
-            price_min_val = float(price_min) if price_min else None
-        except:
-            price_min_val = None
-        
-        try:
-            price_max_val = float(price_max) if price_max else None
-        except:
-            price_max_val = None
-        
-        try:
-            min_rating_val = float(min_rating) if min_rating else None
-        except:
-            min_rating_val = None
-        
-        # Выполнить поиск с использованием SearchService - Требования: 8.1, 8.2, 8.3, 8.4
-        all_masterclasses = SearchService.search_masterclasses(
-            query=query if query else None,
-            category=category if category else None,
-            date_from=date_from_obj,
-            date_to=date_to_obj,
-            price_min=price_min_val,
-            price_max=price_max_val,
-            min_rating=min_rating_val,
-            sort_by=sort_by,
-            sort_order=sort_order
-        )
-        
-        # Пагинация для бесконечной прокрутки
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        masterclasses = all_masterclasses[start_idx:end_idx]
-        
-        # Сохранить поисковые предпочтения - Требование: 8.5
-        if user_id and request.args.get('save_preferences') == '1':
-            preferences = {
-                'category': category,
-                'price_min': price_min_val,
-                'price_max': price_max_val,
-                'min_rating': min_rating_val,
-                'sort_by': sort_by,
-                'sort_order': sort_order
-            }
-            SearchService.save_search_preferences(user_id, preferences)
-            if not is_ajax:
-                flash('Поисковые предпочтения сохранены', 'success')
-        
-        # Получить рейтинги для результатов
-        for mc in masterclasses:
-            rating = ReviewService.get_masterclass_average_rating(mc.id)
-            count = ReviewService.get_masterclass_review_count(mc.id)
-            masterclass_ratings[mc.id] = {'rating': rating, 'count': count}
-    
-    # Если это AJAX запрос, вернуть JSON
-    if is_ajax:
-        masterclasses_data = []
-        for mc in masterclasses:
-            mc_data = {
-                'id': mc.id,
-                'title': mc.title,
-                'description': mc.description,
-                'date_time': mc.date_time.strftime('%d.%m.%Y в %H:%M'),
-                'category': mc.category,
-                'price': float(mc.price) if mc.price else None,
-                'max_participants': mc.max_participants,
-                'current_participants': mc.current_participants,
-                'rating': masterclass_ratings.get(mc.id, {}).get('rating'),
-                'review_count': masterclass_ratings.get(mc.id, {}).get('count', 0)
-            }
-            masterclasses_data.append(mc_data)
-        
-        return jsonify({
-            'masterclasses': masterclasses_data,
-            'page': page,
-            'has_more': len(all_masterclasses) > end_idx
-        })
-    
-    # Получить популярные категории
-    popular_categories = SearchService.get_popular_categories()
-    
-    return render_template(
-        'public/search.html',
-        form=form,
-        masterclasses=masterclasses,
-        masterclass_ratings=masterclass_ratings,
-        popular_categories=popular_categories,
-        saved_preferences=saved_preferences,
-        current_sort=sort_by,
-        current_order=sort_order
-    )
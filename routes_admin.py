@@ -2,18 +2,99 @@
 Маршруты для административной панели
 Требования: 5.1, 5.2, 5.3, 5.4, 5.5
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+import hashlib
+import time
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session, g, abort,
+                   make_response, current_app)
 from functools import wraps
 from forms import (LoginForm, AdminCreateUserForm, AdminUserForm, AdminRoleForm, 
                    MasterclassForm)
 from services import (UserService, AdminService, MasterclassService, 
                      RegistrationService, EventCreatorService, ReviewService)
-from models import User, EventCreator, Masterclass
+from models import User, EventCreator
+from error_handlers import DatabaseConnectionError
 
 # Blueprint для администраторов
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 
+class _AdminUrls:
+    """
+    Ссылки админ-панели без параметров для шаблонов ({{ g.urls.users }}):
+    url_for для каждой вызывается один раз за запрос и только при обращении
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        url = url_for(f'admin.{name}')
+        setattr(self, name, url)
+        return url
+
+
+@admin_bp.before_request
+def _init_urls():
+    g.urls = _AdminUrls()
+
+# Максимальный размер страницы списков админ-панели
+ADMIN_PAGE_SIZE = 50
+
+
+def _page_args():
+    """Номер и размер страницы из ?page=&per_page= (размер ограничен ADMIN_PAGE_SIZE)"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', ADMIN_PAGE_SIZE, type=int), 1), ADMIN_PAGE_SIZE)
+    return page, per_page
+
+
+def _flag_arg(name):
+    """Флаг из строки запроса: ?name=true/1/yes/on (без учета регистра)"""
+    value = request.args.get(name)
+    return value is not None and value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# Суффиксы, которые Flask-Compress добавляет к ETag сжатого ответа ("<etag>:gzip")
+_COMPRESSED_ETAG_SUFFIXES = ('', ':gzip', ':br', ':deflate')
+
+
+def _list_etag(*resources):
+    """
+    Слабый ETag страницы списка: версия данных ресурсов, текущий администратор
+    и параметры запроса (фильтры, страница). Получасовой интервал в ключе не дает
+    отдавать из кэша страницу с просроченным CSRF-токеном в формах.
+    None, если ETag выключены (ADMIN_ETAGS_ENABLED, по умолчанию - только с Redis).
+    """
+    if not current_app.config.get('ADMIN_ETAGS_ENABLED'):
+        return None
+    fingerprint = AdminService.get_list_fingerprint(*resources)
+    raw = f'{fingerprint}|{g.current_user.id}|{request.full_path}|{int(time.time()) // 1800}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _with_etag(response, etag):
+    """Проставить ETag; кэшировать можно только в браузере и с проверкой при каждом запросе"""
+    if etag is None:
+        return response
+    response = make_response(response)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _not_modified(etag):
+    """
+    Ответ 304, если у клиента актуальная копия страницы, иначе None.
+    При ожидающих flash-сообщениях страница рендерится всегда, иначе сообщение потеряется.
+    Клиент присылает ETag сжатого ответа, поэтому сравниваются и варианты с суффиксом сжатия.
+    """
+    if etag is None or session.get('_flashes'):
+        return None
+    if any(request.if_none_match.contains_weak(etag + suffix) for suffix in _COMPRESSED_ETAG_SUFFIXES):
+        return _with_etag(('', 304), etag)
+    return None
+
+
 def login_required(f):
     """Декоратор для проверки аутентификации"""
     @wraps(f)
@@ -38,6 +119,8 @@ def admin_required(f):
             flash('Доступ запрещен. Требуются права администратора', 'error')
             return redirect(url_for('public.index'))
         
+        # Представления берут текущего пользователя отсюда, без повторной загрузки
+        g.current_user = user
         return f(*args, **kwargs)
     return decorated_function
 
@@ -48,14 +131,24 @@ def login():
     Страница входа для администраторов
     Требования: 5.1
     """
-    # Если пользователь уже вошел, перенаправить на панель
+    # Если администратор уже вошел, перенаправить на панель. Роль проверяется по БД:
+    # у пониженного администратора в сессии осталась бы роль admin, а admin_required
+    # не пустит его на панель - без формы входа он не смог бы войти заново
     if 'user_id' in session:
         user = UserService.get_user_by_id(session['user_id'])
-        if user and user.is_admin():
+        if user is not None and user.is_admin():
             return redirect(url_for('admin.dashboard'))
+        if user is None:
+            session.clear()
+        else:
+            session['user_role'] = user.role
     
     form = LoginForm()
     
+    if request.method == 'POST' and UserService.login_attempts_exceeded(request.remote_addr):
+        flash('Слишком много попыток входа. Повторите через минуту', 'error')
+        return render_template('admin/login.html', form=form), 429
+    
     if form.validate_on_submit():
         user = UserService.authenticate_user(form.email.data, form.password.data)
         
@@ -94,24 +187,26 @@ def dashboard():
     Административная панель с общей статистикой
     Требования: 5.1
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    
-    # Получить статистику системы
-    stats = AdminService.get_system_statistics()
+    user = g.current_user
+    etag = _list_etag('users', 'masterclasses')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
     
     # Получить последних пользователей
-    recent_users = AdminService.get_all_users()[:5]
+    recent_users = AdminService.get_recent_users(5)
     
     # Получить последние мастер-классы
-    recent_masterclasses = AdminService.get_all_masterclasses()[:5]
+    recent_masterclasses = AdminService.get_recent_masterclasses(5)
     
-    return render_template(
+    return _with_etag(render_template(
         'admin/dashboard.html',
         user=user,
-        stats=stats,
+        # Статистика считается только при промахе кэша фрагмента в шаблоне
+        load_stats=AdminService.get_system_statistics,
         recent_users=recent_users,
         recent_masterclasses=recent_masterclasses
-    )
+    ), etag)
 
 
 @admin_bp.route('/users')
@@ -121,26 +216,30 @@ def users():
     Список всех пользователей
     Требования: 5.1, 5.2
     """
-    user = UserService.get_user_by_id(session['user_id'])
+    user = g.current_user
+    etag = _list_etag('users')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
     
     # Получить параметры фильтрации
-    show_inactive = request.args.get('show_inactive', 'false') == 'true'
+    show_inactive = _flag_arg('show_inactive')
     role_filter = request.args.get('role', None)
     
-    # Получить всех пользователей
-    all_users = AdminService.get_all_users(include_inactive=show_inactive)
-    
-    # Фильтрация по роли
-    if role_filter:
-        all_users = [u for u in all_users if u.role == role_filter]
+    # Получить страницу пользователей с фильтрацией по роли в БД
+    page, per_page = _page_args()
+    pagination = AdminService.get_users_page(
+        include_inactive=show_inactive, role=role_filter, page=page, per_page=per_page
+    )
     
-    return render_template(
+    return _with_etag(render_template(
         'admin/users.html',
         user=user,
-        all_users=all_users,
+        all_users=pagination.items,
+        pagination=pagination,
         show_inactive=show_inactive,
         role_filter=role_filter
-    )
+    ), etag)
 
 
 @admin_bp.route('/users/create', methods=['GET', 'POST'])
@@ -150,7 +249,7 @@ def create_user():
     Создание нового пользователя
     Требования: 5.1, 5.2
     """
-    user = UserService.get_user_by_id(session['user_id'])
+    user = g.current_user
     form = AdminCreateUserForm()
     
     if form.validate_on_submit():
@@ -182,8 +281,10 @@ def edit_user(user_id):
     Редактирование пользователя
     Требования: 5.1, 5.2
     """
-    current_user = UserService.get_user_by_id(session['user_id'])
-    target_user = User.query.get_or_404(user_id)
+    current_user = g.current_user
+    target_user = AdminService.get_user(user_id)
+    if target_user is None:
+        abort(404)
     
     form = AdminUserForm()
     
@@ -241,14 +342,15 @@ def block_user(user_id):
         flash('Вы не можете заблокировать себя', 'error')
         return redirect(url_for('admin.users'))
     
-    target_user = User.query.get_or_404(user_id)
-    
-    success = AdminService.block_user(user_id)
-    
-    if success:
-        flash(f'Пользователь {target_user.name} заблокирован', 'success')
-    else:
+    try:
+        user_name = AdminService.set_user_active(user_id, False)
+    except DatabaseConnectionError:
         flash('Ошибка блокировки пользователя', 'error')
+        return redirect(url_for('admin.users'))
+    if user_name is None:
+        abort(404)
+    
+    flash(f'Пользователь {user_name} заблокирован', 'success')
     
     return redirect(url_for('admin.users'))
 
@@ -260,14 +362,15 @@ def unblock_user(user_id):
     Разблокировка пользователя
     Требования: 5.2
     """
-    target_user = User.query.get_or_404(user_id)
-    
-    success = AdminService.unblock_user(user_id)
-    
-    if success:
-        flash(f'Пользователь {target_user.name} разблокирован', 'success')
-    else:
+    try:
+        user_name = AdminService.set_user_active(user_id, True)
+    except DatabaseConnectionError:
         flash('Ошибка разблокировки пользователя', 'error')
+        return redirect(url_for('admin.users'))
+    if user_name is None:
+        abort(404)
+    
+    flash(f'Пользователь {user_name} разблокирован', 'success')
     
     return redirect(url_for('admin.users'))
 
@@ -304,8 +407,10 @@ def assign_role(user_id):
     Назначение роли пользователю
     Требования: 5.5
     """
-    current_user = UserService.get_user_by_id(session['user_id'])
-    target_user = User.query.get_or_404(user_id)
+    current_user = g.current_user
+    target_user = AdminService.get_user(user_id)
+    if target_user is None:
+        abort(404)
     
     form = AdminRoleForm()
     
@@ -336,26 +441,30 @@ def masterclasses():
     Список всех мастер-классов
     Требования: 5.3
     """
-    user = UserService.get_user_by_id(session['user_id'])
+    user = g.current_user
+    etag = _list_etag('masterclasses', 'users')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
     
     # Получить параметры фильтрации
-    show_inactive = request.args.get('show_inactive', 'false') == 'true'
+    show_inactive = _flag_arg('show_inactive')
     category_filter = request.args.get('category', None)
     
-    # Получить все мастер-классы
-    all_masterclasses = AdminService.get_all_masterclasses(include_inactive=show_inactive)
-    
-    # Фильтрация по категории
-    if category_filter:
-        all_masterclasses = [m for m in all_masterclasses if m.category == category_filter]
+    # Получить страницу мастер-классов с фильтрацией по категории в БД
+    page, per_page = _page_args()
+    pagination = AdminService.get_masterclasses_page(
+        include_inactive=show_inactive, category=category_filter, page=page, per_page=per_page
+    )
     
-    return render_template(
+    return _with_etag(render_template(
         'admin/masterclasses.html',
         user=user,
-        masterclasses=all_masterclasses,
+        masterclasses=pagination.items,
+        pagination=pagination,
         show_inactive=show_inactive,
         category_filter=category_filter
-    )
+    ), etag)
 
 
 @admin_bp.route('/masterclasses/<int:masterclass_id>')
@@ -365,8 +474,10 @@ def masterclass_detail(masterclass_id):
     Детальная информация о мастер-классе
     Требования: 5.3
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    masterclass = Masterclass.query.get_or_404(masterclass_id)
+    user = g.current_user
+    masterclass = AdminService.get_masterclass(masterclass_id)
+    if masterclass is None:
+        abort(404)
     
     # Получить список участников
     participants = RegistrationService.get_masterclass_participants(masterclass_id)
@@ -386,8 +497,10 @@ def delete_masterclass(masterclass_id):
     Удаление мастер-класса
     Требования: 5.4
     """
-    masterclass = Masterclass.query.get_or_404(masterclass_id)
-    masterclass_title = masterclass.title
+    # Для сообщения нужно только название - без загрузки всей строки
+    masterclass_title = MasterclassService.get_masterclass_title(masterclass_id)
+    if masterclass_title is None:
+        abort(404)
     
     # Удалить мастер-класс (без проверки creator_id, т.к. администратор)
     success = MasterclassService.delete_masterclass(masterclass_id)
@@ -407,20 +520,18 @@ def toggle_masterclass_active(masterclass_id):
     Активация/деактивация мастер-класса
     Требования: 5.3
     """
-    masterclass = Masterclass.query.get_or_404(masterclass_id)
-    
     # Переключить статус активности
-    new_status = not masterclass.is_active
-    success = MasterclassService.update_masterclass(
-        masterclass_id,
-        is_active=new_status
-    )
-    
-    if success:
-        status_text = 'активирован' if new_status else 'деактивирован'
-        flash(f'Мастер-класс "{masterclass.title}" {status_text}', 'success')
-    else:
+    try:
+        result = AdminService.toggle_masterclass_active(masterclass_id)
+    except DatabaseConnectionError:
         flash('Ошибка изменения статуса мастер-класса', 'error')
+        return redirect(url_for('admin.masterclasses'))
+    if result is None:
+        abort(404)
+    
+    title, new_status = result
+    status_text = 'активирован' if new_status else 'деактивирован'
+    flash(f'Мастер-класс "{title}" {status_text}', 'success')
     
     return redirect(url_for('admin.masterclasses'))
 
@@ -432,25 +543,47 @@ def reviews():
     Модерация отзывов
     Требования: 10.4
     """
-    user = UserService.get_user_by_id(session['user_id'])
+    user = g.current_user
+    etag = _list_etag('reviews', 'users', 'masterclasses')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
     
     # Получить параметры фильтрации
-    show_approved = request.args.get('show_approved', 'false') == 'true'
+    show_approved = _flag_arg('show_approved')
     
-    if show_approved:
-        # Показать все отзывы
-        from models import Review
-        all_reviews = Review.query.order_by(Review.created_at.desc()).all()
-    else:
-        # Показать только неодобренные отзывы
-        all_reviews = ReviewService.get_pending_reviews()
+    # Страница всех отзывов или только неодобренных
+    page, per_page = _page_args()
+    pagination = ReviewService.get_reviews_page(
+        include_approved=show_approved, page=page, per_page=per_page
+    )
     
-    return render_template(
+    return _with_etag(render_template(
         'admin/reviews.html',
         user=user,
-        reviews=all_reviews,
+        reviews=pagination.items,
+        pagination=pagination,
         show_approved=show_approved
-    )
+    ), etag)
+
+
+@admin_bp.route('/reviews/bulk', methods=['POST'])
+@admin_required
+def bulk_reviews():
+    """
+    Массовая модерация отмеченных отзывов: одобрить, отклонить или удалить
+    Требования: 10.4
+    """
+    review_ids = request.form.getlist('review_ids', type=int)
+    action = request.form.get('action', '')
+    
+    if not review_ids or action not in ('approve', 'reject', 'delete'):
+        flash('Выберите отзывы и действие', 'warning')
+    else:
+        changed = ReviewService.bulk_moderate(review_ids, action)
+        flash(f'Обработано отзывов: {changed}', 'success')
+    
+    return redirect(url_for('admin.reviews', show_approved=request.form.get('show_approved') or None))
 
 
 @admin_bp.route('/reviews/<int:review_id>/approve', methods=['POST'])
@@ -2,7 +2,7 @@
 Маршруты для панели создателей ивентов
 Требования: 4.1, 4.2, 4.3, 4.4, 4.5
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g
 from functools import wraps
 from forms import (LoginForm, UserRegistrationForm, MasterclassForm, 
                    EventCreatorProfileForm)
@@ -33,11 +33,14 @@ def creator_required(f):
             flash('Пожалуйста, войдите в систему', 'warning')
             return redirect(url_for('creator.login'))
         
-        user = UserService.get_user_by_id(session['user_id'])
+        user = UserService.get_user_with_creator(session['user_id'])
         if not user or not user.is_event_creator():
             flash('Доступ запрещен. Требуется роль создателя ивентов', 'error')
             return redirect(url_for('public.index'))
         
+        # Представления берут пользователя и профиль создателя отсюда, без повторных запросов
+        g.current_user = user
+        g.creator = user.event_creator_profile
         return f(*args, **kwargs)
     return decorated_function
 
@@ -131,8 +134,8 @@ def dashboard():
     """
     from services import AnalyticsService
     
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
@@ -164,8 +167,8 @@ def profile():
     Страница профиля создателя ивентов
     Требования: 4.1
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
@@ -200,8 +203,8 @@ def create_masterclass():
     Создание нового мастер-класса
     Требования: 4.2
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
@@ -236,22 +239,18 @@ def edit_masterclass(masterclass_id):
     Редактирование собственного мастер-класса
     Требования: 4.3
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    masterclass = MasterclassService.get_masterclass_by_id(masterclass_id)
+    # Мастер-класс загружается, только если принадлежит текущему создателю
+    masterclass = MasterclassService.get_owned_masterclass(masterclass_id, creator.id)
     
     if not masterclass:
-        flash('Мастер-класс не найден', 'error')
-        return redirect(url_for('creator.dashboard'))
-    
-    # Проверить, что мастер-класс принадлежит текущему создателю
-    if masterclass.creator_id != creator.id:
-        flash('У вас нет прав для редактирования этого мастер-класса', 'error')
+        flash('Мастер-класс не найден или у вас нет прав для редактирования этого мастер-класса', 'error')
         return redirect(url_for('creator.dashboard'))
     
     form = MasterclassForm()
@@ -297,22 +296,18 @@ def view_participants(masterclass_id):
     Просмотр списка участников своего мастер-класса
     Требования: 4.5
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    masterclass = MasterclassService.get_masterclass_by_id(masterclass_id)
+    # Мастер-класс загружается, только если принадлежит текущему создателю
+    masterclass = MasterclassService.get_owned_masterclass(masterclass_id, creator.id)
     
     if not masterclass:
-        flash('Мастер-класс не найден', 'error')
-        return redirect(url_for('creator.dashboard'))
-    
-    # Проверить, что мастер-класс принадлежит текущему создателю
-    if masterclass.creator_id != creator.id:
-        flash('У вас нет прав для просмотра участников этого мастер-класса', 'error')
+        flash('Мастер-класс не найден или у вас нет прав для просмотра участников этого мастер-класса', 'error')
         return redirect(url_for('creator.dashboard'))
     
     # Получить список участников
@@ -333,22 +328,18 @@ def delete_masterclass(masterclass_id):
     Удаление собственного мастер-класса
     Требования: 4.4
     """
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    masterclass = MasterclassService.get_masterclass_by_id(masterclass_id)
+    # Мастер-класс загружается, только если принадлежит текущему создателю
+    masterclass = MasterclassService.get_owned_masterclass(masterclass_id, creator.id)
     
     if not masterclass:
-        flash('Мастер-класс не найден', 'error')
-        return redirect(url_for('creator.dashboard'))
-    
-    # Проверить, что мастер-класс принадлежит текущему создателю
-    if masterclass.creator_id != creator.id:
-        flash('У вас нет прав для удаления этого мастер-класса', 'error')
+        flash('Мастер-класс не найден или у вас нет прав для удаления этого мастер-класса', 'error')
         return redirect(url_for('creator.dashboard'))
     
     masterclass_title = masterclass.title
@@ -373,8 +364,8 @@ def analytics():
     """
     from services import AnalyticsService
     
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
@@ -408,22 +399,18 @@ def masterclass_analytics(masterclass_id):
     """
     from services import AnalyticsService
     
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    masterclass = MasterclassService.get_masterclass_by_id(masterclass_id)
+    # Мастер-класс загружается, только если принадлежит текущему создателю
+    masterclass = MasterclassService.get_owned_masterclass(masterclass_id, creator.id)
     
     if not masterclass:
-        flash('Мастер-класс не найден', 'error')
-        return redirect(url_for('creator.dashboard'))
-    
-    # Проверить, что мастер-класс принадлежит текущему создателю
-    if masterclass.creator_id != creator.id:
-        flash('У вас нет прав для просмотра аналитики этого мастер-класса', 'error')
+        flash('Мастер-класс не найден или у вас нет прав для просмотра аналитики этого мастер-класса', 'error')
         return redirect(url_for('creator.dashboard'))
     
     # Получить аналитику мастер-класса
@@ -445,39 +432,28 @@ def export_participants_csv(masterclass_id):
     Экспорт списка участников в CSV
     Требования: 9.4
     """
-    from flask import Response
+    from flask import Response, stream_with_context
     from services import AnalyticsService
     
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    masterclass = MasterclassService.get_masterclass_by_id(masterclass_id)
+    # Мастер-класс загружается, только если принадлежит текущему создателю
+    masterclass = MasterclassService.get_owned_masterclass(masterclass_id, creator.id)
     
     if not masterclass:
-        flash('Мастер-класс не найден', 'error')
-        return redirect(url_for('creator.dashboard'))
-    
-    # Проверить, что мастер-класс принадлежит текущему создателю
-    if masterclass.creator_id != creator.id:
-        flash('У вас нет прав для экспорта участников этого мастер-класса', 'error')
+        flash('Мастер-класс не найден или у вас нет прав для экспорта участников этого мастер-класса', 'error')
         return redirect(url_for('creator.dashboard'))
     
-    # Экспортировать CSV
-    csv_content = AnalyticsService.export_participants_csv(masterclass_id)
-    
-    if not csv_content:
-        flash('Ошибка экспорта данных', 'error')
-        return redirect(url_for('creator.view_participants', masterclass_id=masterclass_id))
-    
-    # Создать ответ с CSV файлом
+    # Создать ответ с CSV файлом: строки отдаются по мере чтения из БД
     filename = f"participants_{masterclass.title.replace(' ', '_')}_{masterclass.date_time.strftime('%Y%m%d')}.csv"
     
     return Response(
-        csv_content,
+        stream_with_context(AnalyticsService.iter_participants_csv(masterclass_id)),
         mimetype='text/csv',
         headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
@@ -493,8 +469,8 @@ def calendar_view():
     from services import AnalyticsService
     from datetime import datetime
     
-    user = UserService.get_user_by_id(session['user_id'])
-    creator = EventCreatorService.get_creator_by_user_id(user.id)
+    user = g.current_user
+    creator = g.creator
     
     if not creator:
         flash('Профиль создателя не найден', 'error')
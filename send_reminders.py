@@ -10,9 +10,13 @@
 0 * * * * cd /path/to/app && /path/to/venv/bin/python send_reminders.py
 """
 
+import os
 import sys
+import fcntl
 import logging
-from app import app
+import tempfile
+from app import create_app
+from extensions import db
 from services import NotificationService
 
 # Настройка логирования
@@ -27,9 +31,24 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Блокировка от параллельного запуска (если предыдущий запуск еще не завершился)
+LOCK_FILE = os.environ.get('REMINDERS_LOCK_FILE') or os.path.join(tempfile.gettempdir(), 'send_reminders.lock')
+
 
 def send_reminders():
     """Отправить напоминания о предстоящих мастер-классах"""
+    with open(LOCK_FILE, 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.warning("Previous reminder run is still in progress, skipping")
+            return 0
+        # Блокировка снимается при закрытии файла (в том числе при падении процесса)
+        return _send_reminders()
+
+
+def _send_reminders():
+    app = create_app()
     with app.app_context():
         try:
             logger.info("Starting reminder sending process...")
@@ -39,6 +58,9 @@ def send_reminders():
         except Exception as e:
             logger.error(f"Error sending reminders: {e}", exc_info=True)
             return 0
+        finally:
+            # Закрыть сессию и вернуть соединение в пул
+            db.session.remove()
 
 
 if __name__ == '__main__':
@@ -1,14 +1,28 @@
 """
 Сервисы для бизнес-логики веб-портала мастер-классов
 """
+import functools
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from types import SimpleNamespace
+from uuid import uuid4
+from typing import List, Optional, Dict, Any, Tuple
 from flask import current_app
 from flask_mail import Message
 from sqlalchemy.exc import IntegrityError, OperationalError, DatabaseError
-from sqlalchemy import and_, or_
-from extensions import db, mail
-from models import User, EventCreator, Masterclass, Registration, UserProfile, Notification, Review
+from sqlalchemy import and_, or_, select, update, delete, func, case, false, not_
+from sqlalchemy.orm import selectinload, joinedload, lazyload, defer
+from sqlalchemy.orm.attributes import set_committed_value
+from extensions import db, mail, cache
+from cache import per_request_cache, clear_request_cache
+from models import (
+    USER_ROLES, ROLE_ADMIN, User, EventCreator, Masterclass, Registration, UserProfile, Notification, Review,
+    PopularMasterclass, AVAILABLE_MASTERCLASSES_CACHE_TIMEOUT, AUTOCOMPLETE_VERSION_KEY,
+    POPULAR_CATEGORIES_CACHE_KEY, POPULAR_CATEGORIES_CACHE_TIMEOUT, available_masterclasses_cache_key,
+    invalidate_masterclass_caches, invalidate_user_cache, data_version, bump_data_version, verify_dummy_password,
+    casefold
+)
 from error_handlers import (
     MasterclassFullError, DuplicateRegistrationError, TimeConstraintError,
     CancellationTooLateError, DatabaseConnectionError, DataValidationError,
@@ -19,6 +33,69 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Загрузка мастер-класса для страниц каталога и карточки: шаблоны используют
+# только создателя (и его пользователя); отзывы и избранное читаются отдельными
+# запросами, поэтому их selectin-загрузка по умолчанию здесь отключается
+_MASTERCLASS_PAGE_OPTIONS = (
+    joinedload(Masterclass.creator).joinedload(EventCreator.user),
+    lazyload(Masterclass.reviews),
+    lazyload(Masterclass.favorited_by),
+)
+
+# Списки мастер-классов в админ-панели: без длинных описаний (таблица их не показывает)
+_MASTERCLASS_LIST_OPTIONS = (
+    defer(Masterclass.description),
+    joinedload(Masterclass.creator).defer(EventCreator.description),
+    lazyload(Masterclass.reviews),
+    lazyload(Masterclass.favorited_by),
+)
+
+
+def run_in_background(func, *args):
+    """
+    Выполнить func(*args) в фоновом потоке с контекстом текущего приложения,
+    чтобы медленные операции (рассылка писем) не задерживали HTTP-ответ.
+    В режиме TESTING выполняется сразу - тесты видят результат синхронно.
+    """
+    app = current_app._get_current_object()
+    
+    def worker():
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Background task {func.__name__} failed: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+    
+    if app.testing:
+        func(*args)
+        return
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def versioned_cache(timeout, *resources):
+    """
+    Кэширование результата по аргументам и версиям данных ресурсов (data_version):
+    изменение ресурса делает прежние записи недостижимыми, timeout ограничивает
+    устаревание остального. Пустые результаты (ошибка сервиса) не кэшируются.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parts = [func.__qualname__, *map(str, args)]
+            parts += [f'{name}={value}' for name, value in sorted(kwargs.items())]
+            parts += [data_version(resource) for resource in resources]
+            key = ':'.join(parts)
+            result = cache.get(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                if result:
+                    cache.set(key, result, timeout)
+            return result
+        return wrapper
+    return decorator
+
 
 class UserService:
     """Сервис для управления пользователями и аутентификации"""
@@ -57,19 +134,56 @@ class UserService:
         Требования: 5.1
         """
         user = User.query.filter_by(email=email.lower().strip(), is_active=True).first()
-        if user and user.check_password(password):
+        if user is None:
+            # Хэширование все равно выполняется, чтобы по времени ответа нельзя было узнать email
+            verify_dummy_password(password)
+            return None
+        if user.check_password(password):
+            if db.session.is_modified(user):
+                # Сохранить пересчитанный при проверке хэш пароля
+                db.session.commit()
             return user
         return None
     
+    @staticmethod
+    def login_attempts_exceeded(client_addr: str) -> bool:
+        """
+        Учесть попытку входа с адреса; True - лимит попыток за окно исчерпан.
+        Вызывается до проверки пароля, чтобы перебор не тратил CPU на хэширование.
+        """
+        attempts = cache.incr(f'login_attempts:{client_addr}', current_app.config['LOGIN_RATE_WINDOW'])
+        return attempts is not None and attempts > current_app.config['LOGIN_RATE_LIMIT']
+    
     @staticmethod
     def get_user_by_id(user_id: int) -> Optional[User]:
         """Получить пользователя по ID"""
-        return User.query.filter_by(id=user_id, is_active=True).first()
+        user = User.get_by_id(user_id)
+        return user if user is not None and user.is_active else None
+    
+    @staticmethod
+    def get_user_with_creator(user_id: int) -> Optional[User]:
+        """
+        Получить активного пользователя вместе с профилем создателя
+        (user.event_creator_profile уже загружен): из кэша, а без него - одним запросом
+        """
+        if current_app.config.get('USER_CACHE_ENABLED'):
+            user = UserService.get_user_by_id(user_id)
+            if user is not None and 'event_creator_profile' not in user.__dict__:
+                set_committed_value(user, 'event_creator_profile', EventCreator.get_by_user_id(user_id))
+            return user
+        
+        return db.session.execute(
+            select(User)
+            .options(joinedload(User.event_creator_profile).lazyload(EventCreator.user),
+                     lazyload(User.profile))
+            .where(User.id == user_id, User.is_active.is_(True))
+        ).unique().scalar_one_or_none()
     
     @staticmethod
     def get_user_by_email(email: str) -> Optional[User]:
         """Получить пользователя по email"""
-        return User.query.filter_by(email=email.lower().strip(), is_active=True).first()
+        user = User.get_by_email(email)
+        return user if user is not None and user.is_active else None
     
     @staticmethod
     def update_user(user_id: int, **kwargs) -> bool:
@@ -140,7 +254,7 @@ class EventCreatorService:
         try:
             # Проверить, что пользователь существует и имеет соответствующую роль
             user = User.query.get(user_id)
-            if not user or user.role != 'event_creator':
+            if not user or not user.is_event_creator():
                 return None
             
             # Проверить, что профиль создателя еще не существует
@@ -208,9 +322,9 @@ class MasterclassService:
         Требования: 1.1, 1.5, 5.4
         """
         try:
-            query = Masterclass.query.filter(
+            query = Masterclass.query.options(*_MASTERCLASS_PAGE_OPTIONS).filter(
                 Masterclass.is_active == True,
-                Masterclass.date_time > datetime.utcnow()
+                Masterclass.is_upcoming
             )
             
             if category:
@@ -231,10 +345,81 @@ class MasterclassService:
             logger.error(f"Unexpected error fetching masterclasses: {e}", exc_info=True)
             return []
     
+    @staticmethod
+    def get_available_masterclasses_cached(category: str = None) -> List[Masterclass]:
+        """
+        Доступные мастер-классы для каталога с кэшем на AVAILABLE_MASTERCLASSES_CACHE_TIMEOUT секунд.
+        Кэш сбрасывается при изменении мастер-классов; число участников может
+        отставать от БД не дольше времени жизни кэша.
+        Требования: 1.1, 1.5, 5.4
+        """
+        key = available_masterclasses_cache_key(category)
+        cached = cache.get(key)
+        if cached is None:
+            masterclasses = MasterclassService.get_available_masterclasses(category=category)
+            cache.set(key, [mc.to_cache() for mc in masterclasses], AVAILABLE_MASTERCLASSES_CACHE_TIMEOUT)
+            return masterclasses
+        
+        now = datetime.utcnow()
+        return [Masterclass.from_cache(values) for values in cached if values['date_time'] > now]
+    
+    @staticmethod
+    def get_popular_masterclasses(limit: int = 6) -> List[PopularMasterclass]:
+        """
+        Самые популярные предстоящие мастер-классы (по участникам и избранному).
+        Читает предрассчитанное представление popular_masterclasses.
+        """
+        try:
+            return PopularMasterclass.query.filter(
+                PopularMasterclass.date_time > datetime.utcnow()
+            ).order_by(
+                PopularMasterclass.score.desc(),
+                PopularMasterclass.date_time.asc()
+            ).limit(limit).all()
+        
+        except Exception as e:
+            logger.error(f"Error getting popular masterclasses: {e}", exc_info=True)
+            return []
+    
+    @staticmethod
+    def refresh_popular_masterclasses() -> bool:
+        """
+        Обновить материализованное представление popular_masterclasses (PostgreSQL).
+        В остальных БД представление обычное и всегда актуально.
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return True
+        try:
+            db.session.execute(db.text('REFRESH MATERIALIZED VIEW CONCURRENTLY popular_masterclasses'))
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing popular masterclasses: {e}", exc_info=True)
+            return False
+    
     @staticmethod
     def get_masterclass_by_id(masterclass_id: int) -> Optional[Masterclass]:
         """Получить мастер-класс по ID"""
-        return Masterclass.query.filter_by(id=masterclass_id, is_active=True).first()
+        return Masterclass.query.options(*_MASTERCLASS_PAGE_OPTIONS).filter_by(
+            id=masterclass_id, is_active=True
+        ).first()
+    
+    @staticmethod
+    def get_owned_masterclass(masterclass_id: int, creator_id: int) -> Optional[Masterclass]:
+        """
+        Получить активный мастер-класс, только если он принадлежит создателю:
+        владелец проверяется в WHERE того же запроса. Профиль создателя уже в сессии,
+        поэтому masterclass.creator берется из identity map без отдельного запроса.
+        """
+        return db.session.execute(
+            select(Masterclass)
+            .options(lazyload(Masterclass.creator), lazyload(Masterclass.reviews),
+                     lazyload(Masterclass.favorited_by))
+            .where(Masterclass.id == masterclass_id,
+                   Masterclass.creator_id == creator_id,
+                   Masterclass.is_active == True)
+        ).scalar_one_or_none()
     
     @staticmethod
     def create_masterclass(creator_id: int, title: str, description: str, date_time: datetime,
@@ -309,11 +494,20 @@ class MasterclassService:
             if creator_id and masterclass.creator_id != creator_id:
                 return False
             
+            old_date_time = masterclass.date_time
             for key, value in kwargs.items():
                 if hasattr(masterclass, key) and key not in ['id', 'creator_id', 'current_participants']:
                     setattr(masterclass, key, value)
             
-            masterclass.updated_at = datetime.utcnow()
+            if masterclass.date_time != old_date_time:
+                # Мастер-класс перенесен - участники получат напоминание о новом времени
+                db.session.execute(
+                    update(Registration)
+                    .where(Registration.masterclass_id == masterclass_id)
+                    .values(reminder_sent=False)
+                    .execution_options(synchronize_session=False)
+                )
+            
             db.session.commit()
             return True
             
@@ -321,6 +515,13 @@ class MasterclassService:
             db.session.rollback()
             return False
     
+    @staticmethod
+    def get_masterclass_title(masterclass_id: int) -> Optional[str]:
+        """Название мастер-класса (включая неактивные) или None, если его нет"""
+        return db.session.execute(
+            select(Masterclass.title).where(Masterclass.id == masterclass_id)
+        ).scalar_one_or_none()
+    
     @staticmethod
     def delete_masterclass(masterclass_id: int, creator_id: int = None) -> bool:
         """
@@ -328,7 +529,13 @@ class MasterclassService:
         Требования: 4.4, 5.4
         """
         try:
-            masterclass = Masterclass.query.get(masterclass_id)
+            # Для удаления нужны только сама строка и регистрации (каскад и уведомления)
+            masterclass = db.session.get(Masterclass, masterclass_id, options=[
+                lazyload(Masterclass.creator),
+                lazyload(Masterclass.reviews),
+                lazyload(Masterclass.favorited_by),
+                selectinload(Masterclass.registrations),
+            ])
             if not masterclass:
                 return False
             
@@ -336,20 +543,17 @@ class MasterclassService:
             if creator_id and masterclass.creator_id != creator_id:
                 return False
             
-            # Получить всех зарегистрированных участников для уведомления
-            registrations = masterclass.registrations.all()
+            # Снимок участников и данных для письма - после удаления ORM-объекты недоступны
+            recipients = [(r.user_email, r.user_name) for r in masterclass.registrations]
+            details = SimpleNamespace(title=masterclass.title, date_time=masterclass.date_time)
             
             # Удалить мастер-класс (каскадное удаление регистраций)
             db.session.delete(masterclass)
             db.session.commit()
             
-            # Отправить уведомления участникам
-            for registration in registrations:
-                EmailService.send_cancellation_notification(
-                    registration.user_email,
-                    registration.user_name,
-                    masterclass
-                )
+            # Уведомления участникам рассылаются в фоне, ответ не ждет SMTP
+            if recipients:
+                run_in_background(MasterclassService._send_cancellations, recipients, details)
             
             return True
             
@@ -357,6 +561,12 @@ class MasterclassService:
             db.session.rollback()
             return False
     
+    @staticmethod
+    def _send_cancellations(recipients: List[Tuple[str, str]], masterclass) -> None:
+        """Отправить письма об отмене мастер-класса всем участникам"""
+        for user_email, user_name in recipients:
+            EmailService.send_cancellation_notification(user_email, user_name, masterclass)
+    
     @staticmethod
     def search_masterclasses(query: str = None, category: str = None, 
                            date_from: datetime = None, date_to: datetime = None) -> List[Masterclass]:
@@ -440,7 +650,12 @@ class RegistrationService:
             if existing_registration:
                 raise DuplicateRegistrationError(user_email, masterclass.title)
             
-            # Создать регистрацию с использованием безопасной операции БД - Требование: 5.4
+            # Атомарно занять место; при гонке за последнее место UPDATE не затронет строк - Требование: 5.3
+            if not Masterclass.try_register(masterclass_id):
+                db.session.rollback()
+                raise MasterclassFullError(masterclass.title)
+            
+            # Создать регистрацию в той же транзакции, что и увеличение счетчика - Требование: 5.4
             def create_registration():
                 registration = Registration(
                     masterclass_id=masterclass_id,
@@ -448,10 +663,6 @@ class RegistrationService:
                     user_email=user_email.lower().strip(),
                     user_phone=user_phone.strip() if user_phone else None
                 )
-                
-                # Увеличить счетчик участников
-                masterclass.current_participants += 1
-                
                 db.session.add(registration)
                 return registration
             
@@ -523,7 +734,7 @@ class RegistrationService:
             
             # Удалить регистрацию и уменьшить счетчик с безопасной операцией БД - Требование: 5.4
             def delete_registration():
-                masterclass.current_participants -= 1
+                Masterclass.release_spot(masterclass_id)
                 db.session.delete(registration)
             
             safe_database_operation(delete_registration)
@@ -559,18 +770,58 @@ class RegistrationService:
             Masterclass.is_active == True
         ).order_by(Masterclass.date_time.asc()).all()
     
+    @staticmethod
+    def get_user_registrations_page(user_email: str, page: int = 1, per_page: int = 20):
+        """
+        Страница регистраций пользователя по email (LIMIT/OFFSET в БД)
+        Требования: 3.1
+        """
+        return Registration.query.filter_by(
+            user_email=user_email.lower().strip()
+        ).join(Masterclass).filter(
+            Masterclass.is_active == True
+        ).order_by(
+            Masterclass.date_time.asc(), Registration.id.asc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
+    
     @staticmethod
     def get_masterclass_participants(masterclass_id: int) -> List[Registration]:
         """
         Получить всех участников мастер-класса
         Требования: 4.5
         """
-        return Registration.query.filter_by(masterclass_id=masterclass_id).order_by(Registration.registered_at.asc()).all()
+        # Данные участника хранятся в самой регистрации; мастер-класс у вызывающего кода уже загружен
+        return Registration.query.options(lazyload(Registration.masterclass)).filter_by(
+            masterclass_id=masterclass_id
+        ).order_by(Registration.registered_at.asc(), Registration.id.asc()).all()
 
 
 class EmailService:
     """Сервис для отправки уведомлений"""
     
+    @staticmethod
+    @contextmanager
+    def batch_connection():
+        """
+        Общее SMTP-соединение для рассылки пачкой или None, если подключиться не удалось.
+        Ошибка при закрытии (сервер уже разорвал соединение) не прерывает рассылку:
+        письма к этому моменту отправлены, их результат уже учтен.
+        """
+        connection = mail.connect()
+        try:
+            connection.__enter__()
+        except Exception as e:
+            logger.error(f"SMTP connection failed: {e}")
+            yield None
+            return
+        try:
+            yield connection
+        finally:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Closing SMTP connection failed: {e}")
+    
     @staticmethod
     def send_registration_confirmation(user_email: str, user_name: str, masterclass: Masterclass) -> bool:
         """
@@ -718,10 +969,14 @@ class EmailService:
             return False
     
     @staticmethod
-    def send_reminder_email(user_email: str, user_name: str, masterclass: Masterclass) -> bool:
+    def send_reminder_email(user_email: str, user_name: str, masterclass: Masterclass,
+                            connection=None) -> bool:
         """
         Отправить email напоминание о предстоящем мастер-классе
         Требования: 7.2
+        
+        connection - открытое SMTP-соединение (mail.connect()) для рассылки пачкой;
+        без него письмо отправляется через отдельное соединение
         """
         try:
             subject = f"Напоминание: {masterclass.title} завтра!"
@@ -747,7 +1002,7 @@ class EmailService:
                 body=body
             )
             
-            mail.send(msg)
+            (connection or mail).send(msg)
             return True
             
         except Exception as e:
@@ -827,15 +1082,56 @@ class AdminService:
     """Сервис для административных функций"""
     
     @staticmethod
-    def get_all_users(include_inactive: bool = False) -> List[User]:
-        """
-        Получить всех пользователей
-        Требования: 5.1
-        """
+    def _users_query(include_inactive: bool = False, role: str = None):
+        """Запрос пользователей для списков админ-панели (новые сначала)"""
         query = User.query
         if not include_inactive:
             query = query.filter_by(is_active=True)
-        return query.order_by(User.created_at.desc()).all()
+        if role:
+            # Неизвестная роль не совпадает ни с одним пользователем (и недопустима для ENUM в PostgreSQL)
+            query = query.filter(User.role == role) if role in USER_ROLES else query.filter(false())
+        return query.order_by(User.created_at.desc(), User.id.desc())
+    
+    @staticmethod
+    def get_all_users(include_inactive: bool = False, role: str = None) -> List[User]:
+        """
+        Получить всех пользователей (при указании role - только с этой ролью)
+        Требования: 5.1
+        """
+        return AdminService._users_query(include_inactive, role).all()
+    
+    @staticmethod
+    def get_users_page(include_inactive: bool = False, role: str = None, page: int = 1, per_page: int = 50):
+        """
+        Страница списка пользователей (LIMIT/OFFSET в БД)
+        Требования: 5.1
+        """
+        return AdminService._users_query(include_inactive, role).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+    
+    @staticmethod
+    def get_user(user_id: int) -> Optional[User]:
+        """
+        Пользователь по ID (включая заблокированных) для форм админ-панели.
+        Формы показывают только поля самого пользователя, поэтому профили,
+        которые по умолчанию присоединяются JOIN, не загружаются.
+        Требования: 5.2, 5.5
+        """
+        return db.session.get(User, user_id, options=[
+            lazyload(User.event_creator_profile),
+            lazyload(User.profile),
+        ])
+    
+    @staticmethod
+    def get_recent_users(limit: int = 5) -> List[User]:
+        """
+        Последние зарегистрированные активные пользователи (ORDER BY ... LIMIT в БД)
+        Требования: 5.1
+        """
+        return User.query.filter_by(is_active=True).order_by(
+            User.created_at.desc(), User.id.desc()
+        ).limit(limit).all()
     
     @staticmethod
     def get_all_event_creators() -> List[EventCreator]:
@@ -843,18 +1139,80 @@ class AdminService:
         Получить всех создателей ивентов
         Требования: 5.1
         """
-        return EventCreator.query.join(User).filter(User.is_active == True).order_by(EventCreator.created_at.desc()).all()
+        return EventCreator.query.join(User).filter(User.is_active == True).order_by(EventCreator.created_at.desc(), EventCreator.id.desc()).all()
     
     @staticmethod
-    def get_all_masterclasses(include_inactive: bool = False) -> List[Masterclass]:
+    def _masterclasses_query(include_inactive: bool = False, category: str = None):
+        """Запрос мастер-классов для списков админ-панели (новые сначала)"""
+        query = Masterclass.query.options(*_MASTERCLASS_LIST_OPTIONS)
+        if not include_inactive:
+            query = query.filter_by(is_active=True)
+        if category:
+            query = query.filter(Masterclass.category == category)
+        return query.order_by(Masterclass.created_at.desc(), Masterclass.id.desc())
+    
+    @staticmethod
+    def get_all_masterclasses(include_inactive: bool = False, category: str = None) -> List[Masterclass]:
         """
-        Получить все мастер-классы
+        Получить все мастер-классы (при указании category - только этой категории)
         Требования: 5.3
         """
-        query = Masterclass.query
-        if not include_inactive:
-            query = query.filter_by(is_active=True)
-        return query.order_by(Masterclass.created_at.desc()).all()
+        return AdminService._masterclasses_query(include_inactive, category).all()
+    
+    @staticmethod
+    def get_masterclasses_page(include_inactive: bool = False, category: str = None,
+                               page: int = 1, per_page: int = 50):
+        """
+        Страница списка мастер-классов (LIMIT/OFFSET в БД)
+        Требования: 5.3
+        """
+        return AdminService._masterclasses_query(include_inactive, category).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+    
+    @staticmethod
+    def get_masterclass(masterclass_id: int) -> Optional[Masterclass]:
+        """
+        Мастер-класс по ID, включая неактивные, с создателем одним запросом
+        Требования: 5.3
+        """
+        return Masterclass.query.options(*_MASTERCLASS_PAGE_OPTIONS).filter_by(id=masterclass_id).first()
+    
+    @staticmethod
+    def get_recent_masterclasses(limit: int = 5) -> List[Masterclass]:
+        """
+        Последние созданные активные мастер-классы (ORDER BY ... LIMIT в БД)
+        Требования: 5.3
+        """
+        return Masterclass.query.options(*_MASTERCLASS_LIST_OPTIONS).filter_by(is_active=True).order_by(
+            Masterclass.created_at.desc(), Masterclass.id.desc()
+        ).limit(limit).all()
+    
+    @staticmethod
+    def set_user_active(user_id: int, is_active: bool) -> Optional[str]:
+        """
+        Заблокировать/разблокировать пользователя одним UPDATE ... RETURNING.
+        Возвращает имя пользователя или None, если пользователь не найден.
+        Требования: 5.2
+        """
+        try:
+            name = db.session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(is_active=is_active)
+                .returning(User.name)
+                .execution_options(synchronize_session=False)
+            ).scalar_one_or_none()
+            db.session.commit()
+        except (OperationalError, DatabaseError) as e:
+            db.session.rollback()
+            logger.error(f"Database error while changing user {user_id} status: {e}")
+            raise DatabaseConnectionError(e)
+        
+        # UPDATE в обход ORM не вызывает событий модели - кэш сбрасывается явно
+        if name is not None:
+            invalidate_user_cache(user_id)
+        return name
     
     @staticmethod
     def block_user(user_id: int) -> bool:
@@ -862,7 +1220,10 @@ class AdminService:
         Заблокировать пользователя
         Требования: 5.2
         """
-        return UserService.deactivate_user(user_id)
+        try:
+            return AdminService.set_user_active(user_id, False) is not None
+        except DatabaseConnectionError:
+            return False
     
     @staticmethod
     def unblock_user(user_id: int) -> bool:
@@ -871,15 +1232,35 @@ class AdminService:
         Требования: 5.2
         """
         try:
-            user = User.query.get(user_id)
-            if user:
-                user.is_active = True
-                db.session.commit()
-                return True
+            return AdminService.set_user_active(user_id, True) is not None
+        except DatabaseConnectionError:
             return False
-        except Exception:
+    
+    @staticmethod
+    def toggle_masterclass_active(masterclass_id: int) -> Optional[Tuple[str, bool]]:
+        """
+        Переключить активность мастер-класса одним UPDATE ... RETURNING.
+        Возвращает (название, новый статус) или None, если мастер-класс не найден.
+        Требования: 5.3
+        """
+        try:
+            row = db.session.execute(
+                update(Masterclass)
+                .where(Masterclass.id == masterclass_id)
+                .values(is_active=not_(Masterclass.is_active))
+                .returning(Masterclass.title, Masterclass.is_active, Masterclass.category)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            db.session.commit()
+        except (OperationalError, DatabaseError) as e:
             db.session.rollback()
-            return False
+            logger.error(f"Database error while toggling masterclass {masterclass_id}: {e}")
+            raise DatabaseConnectionError(e)
+        
+        if row is None:
+            return None
+        invalidate_masterclass_caches(row.category)
+        return row.title, row.is_active
     
     @staticmethod
     def assign_role(user_id: int, role: str) -> bool:
@@ -888,7 +1269,7 @@ class AdminService:
         Требования: 5.5
         """
         try:
-            if role not in ['user', 'event_creator', 'admin']:
+            if role not in USER_ROLES:
                 return False
             
             user = User.query.get(user_id)
@@ -924,8 +1305,8 @@ class AdminService:
                 return False
             
             # Проверить, что это не единственный администратор
-            if user.role == 'admin':
-                admin_count = User.query.filter_by(role='admin', is_active=True).count()
+            if user.is_admin():
+                admin_count = User.query.filter(User.has_role(ROLE_ADMIN), User.is_active == True).count()
                 if admin_count <= 1:
                     return False  # Нельзя удалить последнего администратора
             
@@ -937,6 +1318,24 @@ class AdminService:
             db.session.rollback()
             return False
     
+    @staticmethod
+    def get_list_fingerprint(*resources: str) -> str:
+        """
+        Отпечаток данных для ETag страниц админ-панели.
+        Токены версий из кэша; для 'masterclasses' к токену добавляются количество
+        и max(updated_at) - его обновляют и счетчики участников в обход ORM.
+        Требования: 5.1
+        """
+        parts = []
+        for resource in resources:
+            parts.append(data_version(resource))
+            if resource == 'masterclasses':
+                count, last_updated = db.session.execute(
+                    select(func.count(Masterclass.id), func.max(Masterclass.updated_at))
+                ).one()
+                parts.append(f'{count}-{last_updated}')
+        return '-'.join(parts)
+    
     @staticmethod
     def get_system_statistics() -> Dict[str, Any]:
         """
@@ -944,19 +1343,38 @@ class AdminService:
         Требования: 5.1
         """
         try:
+            now = datetime.utcnow()
+            
+            # Пользователи: активные и активные создатели - одним запросом
+            total_users, total_event_creators = db.session.execute(
+                select(func.count(User.id), func.count(EventCreator.id))
+                .select_from(User)
+                .outerjoin(EventCreator, EventCreator.user_id == User.id)
+                .where(User.is_active == True)
+            ).one()
+            
+            # Мастер-классы: всего, предстоящие и регистрации на активные - одним запросом
+            registrations = (
+                select(func.count(Registration.id))
+                .join(Masterclass, Registration.masterclass_id == Masterclass.id)
+                .where(Masterclass.is_active == True)
+                .scalar_subquery()
+            )
+            total_masterclasses, upcoming, total_registrations = db.session.execute(
+                select(
+                    func.count(Masterclass.id),
+                    func.coalesce(func.sum(case((Masterclass.date_time > now, 1), else_=0)), 0),
+                    registrations
+                ).where(Masterclass.is_active == True)
+            ).one()
+            
             stats = {
-                'total_users': User.query.filter_by(is_active=True).count(),
-                'total_event_creators': EventCreator.query.join(User).filter(User.is_active == True).count(),
-                'total_masterclasses': Masterclass.query.filter_by(is_active=True).count(),
-                'total_registrations': Registration.query.join(Masterclass).filter(Masterclass.is_active == True).count(),
-                'upcoming_masterclasses': Masterclass.query.filter(
-                    Masterclass.is_active == True,
-                    Masterclass.date_time > datetime.utcnow()
-                ).count(),
-                'past_masterclasses': Masterclass.query.filter(
-                    Masterclass.is_active == True,
-                    Masterclass.date_time <= datetime.utcnow()
-                ).count()
+                'total_users': total_users,
+                'total_event_creators': total_event_creators,
+                'total_masterclasses': total_masterclasses,
+                'total_registrations': total_registrations,
+                'upcoming_masterclasses': upcoming,
+                'past_masterclasses': total_masterclasses - upcoming
             }
             return stats
         except Exception:
@@ -1022,6 +1440,7 @@ class ReviewService:
             
             db.session.add(review)
             db.session.commit()
+            clear_request_cache()
             
             logger.info(f"Review created by user {user_id} for masterclass {masterclass_id}")
             return review
@@ -1052,7 +1471,51 @@ class ReviewService:
         if approved_only:
             query = query.filter_by(is_approved=True)
         
-        return query.order_by(Review.created_at.desc()).all()
+        return query.order_by(Review.created_at.desc(), Review.id.desc()).all()
+    
+    @staticmethod
+    def get_masterclass_reviews_page(masterclass_id: int, page: int = 1, per_page: int = 20):
+        """
+        Страница одобренных отзывов о мастер-классе (LIMIT/OFFSET в БД)
+        Требования: 10.4
+        """
+        return Review.query.filter_by(
+            masterclass_id=masterclass_id,
+            is_approved=True
+        ).order_by(
+            Review.created_at.desc(), Review.id.desc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
+    
+    @staticmethod
+    def get_recent_reviews(masterclass_id: int, limit: int = 3) -> List[Review]:
+        """
+        Последние одобренные отзывы о мастер-классе (LIMIT на стороне БД)
+        Требования: 10.4
+        """
+        return Review.query.filter_by(
+            masterclass_id=masterclass_id,
+            is_approved=True
+        ).order_by(Review.created_at.desc(), Review.id.desc()).limit(limit).all()
+    
+    @staticmethod
+    def get_rating_summary(masterclass_id: int) -> Tuple[Optional[float], int]:
+        """
+        Средний рейтинг (или None) и количество отзывов мастер-класса одним запросом
+        Требования: 10.4
+        """
+        try:
+            row = db.session.execute(
+                select(Masterclass.avg_rating, Masterclass.rating_count)
+                .where(Masterclass.id == masterclass_id)
+            ).first()
+        except Exception as e:
+            logger.error(f"Error fetching rating summary: {e}")
+            return None, 0
+        
+        if row is None:
+            return None, 0
+        average, count = row
+        return (round(average, 1) if average else None), (count or 0)
     
     @staticmethod
     def get_masterclass_average_rating(masterclass_id: int) -> Optional[float]:
@@ -1061,11 +1524,9 @@ class ReviewService:
         Требования: 10.4
         """
         try:
-            from sqlalchemy import func
-            
-            result = db.session.query(func.avg(Review.rating)).filter(
-                Review.masterclass_id == masterclass_id,
-                Review.is_approved == True
+            # Денормализованные счетчики Masterclass вместо агрегации по Review
+            result = db.session.query(Masterclass.avg_rating).filter(
+                Masterclass.id == masterclass_id
             ).scalar()
             
             return round(result, 1) if result else None
@@ -1080,10 +1541,51 @@ class ReviewService:
         Получить количество отзывов о мастер-классе
         Требования: 10.4
         """
-        return Review.query.filter_by(
-            masterclass_id=masterclass_id,
-            is_approved=True
-        ).count()
+        count = db.session.query(Masterclass.rating_count).filter(
+            Masterclass.id == masterclass_id
+        ).scalar()
+        return count or 0
+    
+    @staticmethod
+    def get_ratings_bulk(masterclass_ids) -> Dict[int, Dict[str, Any]]:
+        """
+        Рейтинги нескольких мастер-классов одним запросом:
+        {id: {'rating': средний или None, 'count': количество}}
+        Требования: 10.4
+        """
+        ratings = {masterclass_id: {'rating': None, 'count': 0} for masterclass_id in masterclass_ids}
+        if not ratings:
+            return ratings
+        
+        try:
+            rows = db.session.execute(
+                select(Masterclass.id, Masterclass.avg_rating, Masterclass.rating_count)
+                .where(Masterclass.id.in_(ratings))
+            )
+            for masterclass_id, average, count in rows:
+                ratings[masterclass_id] = {
+                    'rating': round(average, 1) if average else None,
+                    'count': count or 0
+                }
+        except Exception as e:
+            logger.error(f"Error fetching ratings: {e}")
+        
+        return ratings
+    
+    @staticmethod
+    def get_ratings_for(masterclasses: List[Masterclass]) -> Dict[int, Dict[str, Any]]:
+        """
+        Рейтинги уже загруженных мастер-классов из денормализованных колонок, без запросов:
+        {id: {'rating': средний или None, 'count': количество}}
+        Требования: 10.4
+        """
+        return {
+            mc.id: {
+                'rating': round(mc.avg_rating, 1) if mc.avg_rating else None,
+                'count': mc.rating_count or 0
+            }
+            for mc in masterclasses
+        }
     
     @staticmethod
     def get_user_review(user_id: int, masterclass_id: int) -> Optional[Review]:
@@ -1183,18 +1685,91 @@ class ReviewService:
             db.session.rollback()
             return False
     
+    @staticmethod
+    def bulk_moderate(review_ids: List[int], action: str) -> int:
+        """
+        Одобрить, отклонить или удалить несколько отзывов одним запросом.
+        Счетчики рейтинга мастер-классов сдвигаются по затронутым строкам (RETURNING),
+        так как массовые UPDATE/DELETE не вызывают событий модели Review.
+        Возвращает количество измененных отзывов.
+        Требования: 10.4
+        """
+        if action not in ('approve', 'reject', 'delete') or not review_ids:
+            return 0
+        
+        try:
+            if action == 'delete':
+                stmt = delete(Review).where(Review.id.in_(review_ids)).returning(
+                    Review.masterclass_id, Review.rating, Review.is_approved
+                )
+            else:
+                approve = action == 'approve'
+                # Меняются только отзывы, статус которых действительно изменится
+                stmt = update(Review).where(
+                    Review.id.in_(review_ids), Review.is_approved == (not approve)
+                ).values(is_approved=approve).returning(
+                    Review.masterclass_id, Review.rating, Review.is_approved
+                )
+            rows = db.session.execute(stmt.execution_options(synchronize_session=False)).all()
+            
+            # Отзыв входит в рейтинг при одобрении и выходит при отклонении или удалении
+            # одобренного (RETURNING у UPDATE отдает уже новое значение is_approved)
+            deltas = {}
+            for masterclass_id, rating, is_approved in rows:
+                if action == 'delete' and not is_approved:
+                    continue
+                sign = 1 if action == 'approve' else -1
+                rating_sum, rating_count = deltas.get(masterclass_id, (0, 0))
+                deltas[masterclass_id] = (rating_sum + sign * rating, rating_count + sign)
+            
+            for masterclass_id, (rating_delta, count_delta) in deltas.items():
+                if rating_delta or count_delta:
+                    db.session.execute(
+                        update(Masterclass)
+                        .where(Masterclass.id == masterclass_id)
+                        .values(rating_sum=Masterclass.rating_sum + rating_delta,
+                                rating_count=Masterclass.rating_count + count_delta)
+                        .execution_options(synchronize_session=False)
+                    )
+            
+            db.session.commit()
+            if rows:
+                bump_data_version('reviews')
+            logger.info(f"Bulk review moderation '{action}': {len(rows)} reviews")
+            return len(rows)
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error in bulk review moderation: {e}", exc_info=True)
+            return 0
+    
     @staticmethod
     def get_pending_reviews() -> List[Review]:
         """
         Получить все неодобренные отзывы (для модерации)
         Требования: 10.4
         """
-        return Review.query.filter_by(is_approved=False).order_by(Review.created_at.desc()).all()
+        return Review.query.filter_by(is_approved=False).order_by(Review.created_at.desc(), Review.id.desc()).all()
+    
+    @staticmethod
+    def get_reviews_page(include_approved: bool = False, page: int = 1, per_page: int = 50):
+        """
+        Страница отзывов для модерации: только неодобренные или все (LIMIT/OFFSET в БД)
+        Требования: 10.4
+        """
+        query = Review.query
+        if not include_approved:
+            query = query.filter_by(is_approved=False)
+        return query.order_by(
+            Review.created_at.desc(), Review.id.desc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
     
     @staticmethod
+    @per_request_cache
     def can_user_review(user_id: int, masterclass_id: int) -> bool:
         """
         Проверить, может ли пользователь оставить отзыв
+        (результат запоминается до конца HTTP-запроса)
         Требования: 10.4
         """
         try:
@@ -1248,15 +1823,16 @@ class SearchService:
         min_rating: float = None,
         sort_by: str = 'date',
         sort_order: str = 'asc',
-        only_available: bool = True
+        only_available: bool = True,
+        limit: int = None,
+        offset: int = 0
     ) -> List[Masterclass]:
         """
         Комплексный поиск мастер-классов с фильтрацией и сортировкой
+        Фильтры, сортировка и пагинация (limit/offset) выполняются в БД.
         Требования: 8.1, 8.2, 8.3, 8.4
         """
         try:
-            from sqlalchemy import func
-            
             # Базовый запрос
             query_obj = Masterclass.query.filter(Masterclass.is_active == True)
             
@@ -1290,90 +1866,54 @@ class SearchService:
             if price_max is not None:
                 query_obj = query_obj.filter(Masterclass.price <= price_max)
             
-            # Получить результаты
-            masterclasses = query_obj.all()
-            
-            # Фильтрация по рейтингу (после получения из БД)
+            # Фильтрация по рейтингу; рейтинг показывается округленным до 0.1,
+            # поэтому 3.95 проходит фильтр "от 4"
             if min_rating is not None:
-                filtered_masterclasses = []
-                for mc in masterclasses:
-                    avg_rating = ReviewService.get_masterclass_average_rating(mc.id)
-                    if avg_rating is not None and avg_rating >= min_rating:
-                        filtered_masterclasses.append(mc)
-                masterclasses = filtered_masterclasses
+                query_obj = query_obj.filter(Masterclass.avg_rating >= min_rating - 0.05)
             
             # Сортировка результатов - Требование: 8.4
-            masterclasses = SearchService._sort_masterclasses(
-                masterclasses, 
-                sort_by, 
-                sort_order
-            )
+            query_obj = query_obj.order_by(*SearchService._order_by(sort_by, sort_order))
             
-            return masterclasses
+            if offset:
+                query_obj = query_obj.offset(offset)
+            if limit is not None:
+                query_obj = query_obj.limit(limit)
+            
+            return query_obj.all()
             
         except Exception as e:
             logger.error(f"Error in search_masterclasses: {e}", exc_info=True)
             return []
     
     @staticmethod
-    def _sort_masterclasses(
-        masterclasses: List[Masterclass],
-        sort_by: str = 'date',
-        sort_order: str = 'asc'
-    ) -> List[Masterclass]:
+    def _order_by(sort_by: str = 'date', sort_order: str = 'asc') -> tuple:
         """
-        Сортировка результатов поиска
+        Выражения ORDER BY для сортировки результатов поиска
         Требования: 8.4
         """
-        try:
-            reverse = (sort_order == 'desc')
-            
-            if sort_by == 'date':
-                # Сортировка по дате
-                return sorted(masterclasses, key=lambda x: x.date_time, reverse=reverse)
-            
-            elif sort_by == 'price':
-                # Сортировка по цене (None в конец)
-                return sorted(
-                    masterclasses,
-                    key=lambda x: (x.price is None, x.price if x.price is not None else 0),
-                    reverse=reverse
-                )
-            
-            elif sort_by == 'popularity':
-                # Сортировка по популярности (количество регистраций)
-                return sorted(
-                    masterclasses,
-                    key=lambda x: x.current_participants,
-                    reverse=not reverse  # Больше участников = более популярный
-                )
-            
-            elif sort_by == 'title':
-                # Сортировка по названию
-                return sorted(masterclasses, key=lambda x: x.title.lower(), reverse=reverse)
-            
-            elif sort_by == 'rating':
-                # Сортировка по рейтингу
-                masterclasses_with_rating = []
-                for mc in masterclasses:
-                    rating = ReviewService.get_masterclass_average_rating(mc.id)
-                    masterclasses_with_rating.append((mc, rating if rating is not None else 0))
-                
-                sorted_list = sorted(
-                    masterclasses_with_rating,
-                    key=lambda x: x[1],
-                    reverse=not reverse  # Больший рейтинг = лучше
-                )
-                
-                return [mc for mc, _ in sorted_list]
-            
-            else:
-                # По умолчанию сортировка по дате
-                return sorted(masterclasses, key=lambda x: x.date_time, reverse=reverse)
-                
-        except Exception as e:
-            logger.error(f"Error sorting masterclasses: {e}")
-            return masterclasses
+        descending = (sort_order == 'desc')
+        
+        def direction(column, reverse=False):
+            return column.desc() if descending != reverse else column.asc()
+        
+        if sort_by == 'price':
+            # Сортировка по цене (без цены - в конец, при убывании - в начало)
+            order = (direction(Masterclass.price.is_(None)), direction(Masterclass.price))
+        elif sort_by == 'popularity':
+            # Больше участников = более популярный
+            order = (direction(Masterclass.current_participants, reverse=True),)
+        elif sort_by == 'title':
+            # Без учета регистра, в том числе для кириллицы
+            order = (direction(casefold(Masterclass.title)),)
+        elif sort_by == 'rating':
+            # Больший рейтинг = лучше, без оценок - как 0
+            order = (direction(func.coalesce(Masterclass.avg_rating, 0), reverse=True),)
+        else:
+            # По умолчанию сортировка по дате
+            order = (direction(Masterclass.date_time),)
+        
+        # Стабильный порядок страниц при равных значениях
+        return order + (Masterclass.id.asc(),)
     
     @staticmethod
     def filter_by_date_range(start_date: datetime, end_date: datetime) -> List[Masterclass]:
@@ -1417,8 +1957,6 @@ class SearchService:
         Требования: 8.5
         """
         try:
-            import json
-            
             # Получить или создать профиль пользователя
             profile = UserProfile.query.filter_by(user_id=user_id).first()
             
@@ -1426,19 +1964,14 @@ class SearchService:
                 profile = UserProfile(user_id=user_id)
                 db.session.add(profile)
             
-            # Сохранить предпочтения в JSON формате
-            # Используем поле interests для хранения поисковых предпочтений
-            current_prefs = {}
-            if profile.interests:
-                try:
-                    current_prefs = json.loads(profile.interests)
-                except:
-                    current_prefs = {}
-            
+            # Используем поле interests для хранения поисковых предпочтений.
+            # JSON-колонка не отслеживает изменения на месте - присваиваем новый словарь
+            current_prefs = dict(profile.interests or {})
             current_prefs['search_preferences'] = preferences
-            profile.interests = json.dumps(current_prefs)
+            profile.interests = current_prefs
             
             db.session.commit()
+            clear_request_cache()
             logger.info(f"Search preferences saved for user {user_id}")
             return True
             
@@ -1448,24 +1981,20 @@ class SearchService:
             return False
     
     @staticmethod
+    @per_request_cache
     def get_search_preferences(user_id: int) -> Optional[Dict[str, Any]]:
         """
         Получить сохраненные поисковые предпочтения пользователя
+        (результат запоминается до конца HTTP-запроса)
         Требования: 8.5
         """
         try:
-            import json
-            
             profile = UserProfile.query.filter_by(user_id=user_id).first()
             
             if not profile or not profile.interests:
                 return None
             
-            try:
-                prefs = json.loads(profile.interests)
-                return prefs.get('search_preferences')
-            except:
-                return None
+            return profile.interests.get('search_preferences')
                 
         except Exception as e:
             logger.error(f"Error getting search preferences: {e}")
@@ -1474,11 +2003,14 @@ class SearchService:
     @staticmethod
     def get_popular_categories() -> List[tuple]:
         """
-        Получить популярные категории с количеством мастер-классов
+        Получить популярные категории с количеством мастер-классов.
+        Результат кэшируется на 10 минут и сбрасывается при изменении мастер-классов.
         """
+        cached = cache.get(POPULAR_CATEGORIES_CACHE_KEY)
+        if cached is not None:
+            return cached
+        
         try:
-            from sqlalchemy import func
-            
             results = db.session.query(
                 Masterclass.category,
                 func.count(Masterclass.id).label('count')
@@ -1490,6 +2022,8 @@ class SearchService:
                 func.count(Masterclass.id).desc()
             ).all()
             
+            results = [(category, count) for category, count in results]
+            cache.set(POPULAR_CATEGORIES_CACHE_KEY, results, POPULAR_CATEGORIES_CACHE_TIMEOUT)
             return results
             
         except Exception as e:
@@ -1532,24 +2066,26 @@ class SearchService:
                 return []
             
             suggestions = set()
+            # ILIKE в SQLite не учитывает регистр только для ASCII - сравнение через casefold
+            query = query.casefold()
             
             # Поиск по названиям мастер-классов
             masterclasses = Masterclass.query.filter(
                 Masterclass.is_active == True,
                 Masterclass.date_time > datetime.utcnow(),
                 or_(
-                    Masterclass.title.ilike(f'%{query}%'),
-                    Masterclass.description.ilike(f'%{query}%')
+                    casefold(Masterclass.title).like(f'%{query}%'),
+                    casefold(Masterclass.description).like(f'%{query}%')
                 )
             ).limit(limit * 2).all()
             
             # Добавляем названия
             for mc in masterclasses:
-                if query.lower() in mc.title.lower():
+                if query in mc.title.casefold():
                     suggestions.add(mc.title)
                 
                 # Добавляем категории
-                if mc.category and query.lower() in mc.category.lower():
+                if mc.category and query in mc.category.casefold():
                     suggestions.add(mc.category)
             
             # Ограничиваем количество результатов
@@ -1558,6 +2094,29 @@ class SearchService:
         except Exception as e:
             logger.error(f"Error getting autocomplete suggestions: {e}")
             return []
+    
+    @staticmethod
+    def get_autocomplete_suggestions_cached(query: str, limit: int = 10) -> List[str]:
+        """
+        Предложения автодополнения с кэшем на 5 минут по нормализованному запросу.
+        Изменение любого мастер-класса сбрасывает версию кэша.
+        Требования: 8.5
+        """
+        query = query.strip().casefold()[:32]
+        if len(query) < 2:
+            return []
+        
+        version = cache.get(AUTOCOMPLETE_VERSION_KEY)
+        if version is None:
+            version = uuid4().hex
+            cache.set(AUTOCOMPLETE_VERSION_KEY, version, 24 * 3600)
+        
+        key = f'autocomplete:{version}:{limit}:{query}'
+        suggestions = cache.get(key)
+        if suggestions is None:
+            suggestions = SearchService.get_autocomplete_suggestions(query, limit)
+            cache.set(key, suggestions, 300)
+        return suggestions
 
 
 class NotificationService:
@@ -1586,6 +2145,26 @@ class NotificationService:
             logger.error(f"Error creating notification: {e}")
             return None
     
+    @staticmethod
+    def _registered_user_ids(emails) -> List[int]:
+        """ID зарегистрированных пользователей по списку email (один запрос)"""
+        emails = {email for email in emails if email}
+        if not emails:
+            return []
+        return db.session.execute(select(User.id).where(User.email.in_(emails))).scalars().all()
+    
+    @staticmethod
+    def _fan_out(user_ids: List[int], notification_type: str, title: str, message: str) -> int:
+        """Создать уведомления пачкой; ошибка не прерывает рассылку email"""
+        try:
+            count = Notification.fan_out(user_ids, notification_type, title, message)
+            db.session.commit()
+            return count
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error creating notifications: {e}")
+            return 0
+    
     @staticmethod
     def send_status_update(masterclass: Masterclass, message: str) -> bool:
         """
@@ -1593,26 +2172,20 @@ class NotificationService:
         Требования: 7.1, 7.5
         """
         try:
-            registrations = masterclass.registrations.all()
+            # Снимок получателей до commit, чтобы не перечитывать каждую регистрацию
+            recipients = [(r.user_email, r.user_name) for r in masterclass.registrations]
+            
+            # Системные уведомления зарегистрированным пользователям - одним INSERT
+            NotificationService._fan_out(
+                NotificationService._registered_user_ids(email for email, _ in recipients),
+                'update',
+                f'Обновление: {masterclass.title}',
+                message
+            )
             
-            for registration in registrations:
-                # Создать системное уведомление если пользователь зарегистрирован
-                user = User.query.filter_by(email=registration.user_email).first()
-                if user:
-                    NotificationService.create_notification(
-                        user_id=user.id,
-                        notification_type='update',
-                        title=f'Обновление: {masterclass.title}',
-                        message=message
-                    )
-                
+            for user_email, user_name in recipients:
                 # Отправить email уведомление
-                EmailService.send_status_update_email(
-                    registration.user_email,
-                    registration.user_name,
-                    masterclass,
-                    message
-                )
+                EmailService.send_status_update_email(user_email, user_name, masterclass, message)
             
             return True
             
@@ -1649,6 +2222,16 @@ class NotificationService:
         """
         Отправить напоминания за 24 часа до начала мастер-классов
         Требования: 7.2
+        
+        Мастер-классы обрабатываются по одному, после каждого сессия очищается
+        (expunge_all), чтобы identity map не рос с числом регистраций.
+        Все письма уходят через одно SMTP-соединение (без подключения и TLS на каждое).
+        Если общее соединение оборвалось, письмо повторяется через отдельное
+        соединение, и дальше рассылка идет без общего.
+        Успешная отправка сразу отмечается в Registration.reminder_sent: окно ±1 час
+        при запуске раз в час захватывает мастер-класс несколько раз, но письмо и
+        системное уведомление получают только те, кому напоминание еще не ушло.
+        Вызывать вне запроса (cron-скрипт send_reminders.py).
         """
         try:
             # Найти мастер-классы, которые начнутся через 24 часа (±1 час)
@@ -1657,26 +2240,66 @@ class NotificationService:
             time_window_start = target_time - timedelta(hours=1)
             time_window_end = target_time + timedelta(hours=1)
             
-            masterclasses = Masterclass.query.filter(
-                Masterclass.is_active == True,
-                Masterclass.date_time >= time_window_start,
-                Masterclass.date_time <= time_window_end
-            ).all()
+            masterclass_ids = db.session.execute(
+                select(Masterclass.id).where(
+                    Masterclass.is_active == True,
+                    Masterclass.date_time >= time_window_start,
+                    Masterclass.date_time <= time_window_end,
+                    Masterclass.registrations.any(Registration.reminder_sent == False)
+                )
+            ).scalars().all()
+            
+            if not masterclass_ids:
+                return 0
             
             reminder_count = 0
             
-            for masterclass in masterclasses:
-                registrations = masterclass.registrations.all()
-                
-                for registration in registrations:
-                    if NotificationService.send_reminder(
-                        registration.user_email,
-                        registration.user_name,
-                        masterclass
-                    ):
+            # Без общего соединения (None) каждое письмо подключается само
+            with EmailService.batch_connection() as connection:
+                for masterclass_id in masterclass_ids:
+                    masterclass = db.session.get(Masterclass, masterclass_id)
+                    pending = db.session.execute(
+                        select(Registration.id, Registration.user_email, Registration.user_name).where(
+                            Registration.masterclass_id == masterclass_id,
+                            Registration.reminder_sent == False
+                        )
+                    ).all()
+                    
+                    sent_emails = []
+                    for registration_id, user_email, user_name in pending:
+                        sent = EmailService.send_reminder_email(user_email, user_name, masterclass, connection)
+                        if not sent and connection is not None:
+                            # Общее соединение могло оборваться - остальные письма без него
+                            connection = None
+                            sent = EmailService.send_reminder_email(user_email, user_name, masterclass)
+                        if not sent:
+                            continue
+                        # Отметка сразу после письма: сбой дальше по списку не приведет к повтору
+                        db.session.execute(
+                            update(Registration)
+                            .where(Registration.id == registration_id)
+                            .values(reminder_sent=True)
+                            .execution_options(synchronize_session=False)
+                        )
+                        db.session.commit()
+                        sent_emails.append(user_email)
                         reminder_count += 1
+                    
+                    failed = len(pending) - len(sent_emails)
+                    if failed:
+                        logger.warning(f"{failed} reminders for masterclass {masterclass_id} failed, "
+                                       f"will retry on the next run")
+                    
+                    # Системные уведомления - только тем, кому напоминание ушло в этот запуск
+                    NotificationService._fan_out(
+                        NotificationService._registered_user_ids(sent_emails),
+                        'reminder',
+                        f'Напоминание: {masterclass.title}',
+                        f'Мастер-класс начнется завтра в {masterclass.date_time.strftime("%H:%M")}'
+                    )
+                    db.session.expunge_all()
             
-            logger.info(f"Sent {reminder_count} reminders for {len(masterclasses)} masterclasses")
+            logger.info(f"Sent {reminder_count} reminders for {len(masterclass_ids)} masterclasses")
             return reminder_count
             
         except Exception as e:
@@ -1731,7 +2354,7 @@ class NotificationService:
             if unread_only:
                 query = query.filter_by(is_read=False)
             
-            query = query.order_by(Notification.created_at.desc())
+            query = query.order_by(Notification.created_at.desc(), Notification.id.desc())
             
             if limit:
                 query = query.limit(limit)
@@ -1803,12 +2426,46 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error getting unread count: {e}")
             return 0
+    
+    @staticmethod
+    def prune_read_notifications(older_than_days: int = 30, batch_size: int = 10000) -> int:
+        """
+        Удалить прочитанные уведомления старше older_than_days дней.
+        Удаление порциями по batch_size, чтобы не держать длинные блокировки.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        batch = select(Notification.id).where(
+            Notification.is_read == True,
+            Notification.created_at < cutoff
+        ).limit(batch_size).scalar_subquery()
+        
+        deleted = 0
+        try:
+            while True:
+                result = db.session.execute(
+                    delete(Notification)
+                    .where(Notification.id.in_(batch))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                deleted += result.rowcount
+                if result.rowcount < batch_size:
+                    break
+            
+            logger.info(f"Pruned {deleted} read notifications older than {older_than_days} days")
+            return deleted
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error pruning notifications: {e}", exc_info=True)
+            return deleted
 
 
 class AnalyticsService:
     """Сервис для сбора статистики и аналитики"""
     
     @staticmethod
+    @versioned_cache(60, 'masterclasses', 'registrations', 'reviews')
     def get_creator_stats(creator_id: int) -> Dict[str, Any]:
         """
         Получить общую статистику создателя ивентов
@@ -1845,11 +2502,10 @@ class AnalyticsService:
             # Подсчет среднего рейтинга
             ratings = []
             total_reviews = 0
-            for mc in masterclasses:
-                avg_rating = ReviewService.get_masterclass_average_rating(mc.id)
-                if avg_rating:
-                    ratings.append(avg_rating)
-                total_reviews += ReviewService.get_masterclass_review_count(mc.id)
+            for rating in ReviewService.get_ratings_for(masterclasses).values():
+                if rating['rating']:
+                    ratings.append(rating['rating'])
+                total_reviews += rating['count']
             
             average_rating = round(sum(ratings) / len(ratings), 1) if ratings else 0
             
@@ -1886,8 +2542,7 @@ class AnalyticsService:
             ) if masterclass.max_participants > 0 else 0
             
             # Рейтинг и отзывы
-            average_rating = ReviewService.get_masterclass_average_rating(masterclass_id)
-            review_count = ReviewService.get_masterclass_review_count(masterclass_id)
+            average_rating, review_count = ReviewService.get_rating_summary(masterclass_id)
             reviews = ReviewService.get_masterclass_reviews(masterclass_id)
             
             # Доход
@@ -1942,44 +2597,65 @@ class AnalyticsService:
         Требования: 9.4
         """
         try:
-            import csv
-            import io
-            
-            masterclass = Masterclass.query.get(masterclass_id)
-            if not masterclass:
+            if db.session.get(Masterclass, masterclass_id) is None:
                 return None
-            
-            participants = Registration.query.filter_by(masterclass_id=masterclass_id).order_by(
-                Registration.registered_at.asc()
-            ).all()
-            
-            # Создать CSV в памяти
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Заголовки
-            writer.writerow(['№', 'Имя', 'Email', 'Телефон', 'Дата регистрации'])
-            
-            # Данные участников
-            for idx, participant in enumerate(participants, 1):
-                writer.writerow([
-                    idx,
-                    participant.user_name,
-                    participant.user_email,
-                    participant.user_phone or '',
-                    participant.registered_at.strftime('%d.%m.%Y %H:%M')
-                ])
-            
-            csv_content = output.getvalue()
-            output.close()
-            
-            return csv_content
+            return ''.join(AnalyticsService.iter_participants_csv(masterclass_id))
             
         except Exception as e:
             logger.error(f"Error exporting participants CSV: {e}", exc_info=True)
             return None
     
     @staticmethod
+    def iter_participants_csv(masterclass_id: int):
+        """
+        CSV со списком участников построчно (для потоковой отдачи):
+        в памяти одновременно только порция строк из БД и одна строка CSV
+        Требования: 9.4
+        """
+        import csv
+        import io
+        
+        # Только нужные колонки порциями: строки не попадают в identity map,
+        # память не растет с числом участников
+        participants = db.session.execute(
+            select(
+                Registration.user_name,
+                Registration.user_email,
+                Registration.user_phone,
+                Registration.registered_at
+            )
+            .where(Registration.masterclass_id == masterclass_id)
+            .order_by(Registration.registered_at.asc(), Registration.id.asc())
+            .execution_options(yield_per=1000)
+        )
+        
+        # Один буфер на весь экспорт: строка записывается, отдается и буфер очищается
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        def flush():
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return line
+        
+        # Заголовки
+        writer.writerow(['№', 'Имя', 'Email', 'Телефон', 'Дата регистрации'])
+        yield flush()
+        
+        # Данные участников
+        for idx, participant in enumerate(participants, 1):
+            writer.writerow([
+                idx,
+                participant.user_name,
+                participant.user_email,
+                participant.user_phone or '',
+                participant.registered_at.strftime('%d.%m.%Y %H:%M')
+            ])
+            yield flush()
+    
+    @staticmethod
+    @versioned_cache(60, 'masterclasses', 'registrations', 'reviews')
     def get_revenue_report(creator_id: int, period: str = 'all') -> Dict[str, Any]:
         """
         Получить отчет о доходах создателя ивентов
@@ -2092,6 +2768,7 @@ class AnalyticsService:
             return []
     
     @staticmethod
+    @versioned_cache(300, 'masterclasses', 'registrations', 'reviews')
     def get_popularity_stats(creator_id: int) -> Dict[str, Any]:
         """
         Получить статистику популярности мастер-классов
@@ -2114,11 +2791,10 @@ class AnalyticsService:
             )
             
             # Сортировка по рейтингу
-            masterclasses_with_rating = []
-            for mc in masterclasses:
-                rating = ReviewService.get_masterclass_average_rating(mc.id)
-                if rating:
-                    masterclasses_with_rating.append((mc, rating))
+            ratings = ReviewService.get_ratings_for(masterclasses)
+            masterclasses_with_rating = [
+                (mc, ratings[mc.id]['rating']) for mc in masterclasses if ratings[mc.id]['rating']
+            ]
             
             sorted_by_rating = sorted(
                 masterclasses_with_rating,
@@ -2146,7 +2822,7 @@ class AnalyticsService:
                     'id': mc.id,
                     'title': mc.title,
                     'rating': rating,
-                    'review_count': ReviewService.get_masterclass_review_count(mc.id)
+                    'review_count': ratings[mc.id]['count']
                 }
                 for mc, rating in sorted_by_rating[:5]
             ]
@@ -13,10 +13,7 @@ from services import UserService, AdminService, MasterclassService
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    import os
-    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
-    
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
     
@@ -94,6 +91,39 @@ def test_admin_authentication(client, app, admin_user):
         assert response.status_code == 200
 
 
+def test_demoted_admin_sees_login_form(client, app, admin_user):
+    """Тест: администратор, лишенный прав, не перенаправляется с формы входа"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_user
+        sess['user_role'] = 'admin'
+    
+    response = client.get('/admin/login')
+    assert response.status_code == 302
+    
+    AdminService.assign_role(admin_user, 'user')
+    response = client.get('/admin/login')
+    assert response.status_code == 200
+    with client.session_transaction() as sess:
+        assert sess['user_role'] == 'user'
+
+
+def test_admin_login_rate_limited(client, app, admin_user):
+    """Тест: после лимита попыток вход отклоняется с 429 без проверки пароля"""
+    app.config['LOGIN_RATE_LIMIT'] = 3
+    for _ in range(3):
+        response = client.post('/admin/login', data={
+            'email': 'missing@test.com',
+            'password': 'wrong'
+        })
+        assert response.status_code == 200
+
+    response = client.post('/admin/login', data={
+        'email': 'admin@test.com',
+        'password': 'admin123'
+    })
+    assert response.status_code == 429
+
+
 def test_admin_dashboard_requires_auth(client):
     """Тест: панель администратора требует аутентификации"""
     response = client.get('/admin/dashboard')
@@ -156,6 +186,23 @@ def test_admin_can_block_user(client, app, admin_user, regular_user):
         assert user.is_active == False
 
 
+def test_admin_block_user_database_error(client, app, admin_user, regular_user, monkeypatch):
+    """Тест: ошибка БД при блокировке показывает сообщение, а не 500"""
+    from error_handlers import DatabaseConnectionError
+    
+    def failing(user_id, is_active):
+        raise DatabaseConnectionError('connection refused')
+    monkeypatch.setattr(AdminService, 'set_user_active', staticmethod(failing))
+    
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_user
+        sess['user_role'] = 'admin'
+    
+    response = client.post(f'/admin/users/{regular_user}/block')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/users')
+
+
 def test_admin_can_unblock_user(client, app, admin_user, regular_user):
     """Тест: администратор может разблокировать пользователей (Требование 5.2)"""
     with app.app_context():
@@ -261,6 +308,46 @@ def test_admin_cannot_delete_self(client, app, admin_user):
         assert user is not None
 
 
+def test_admin_users_page_filters_and_paginates(app, admin_user, regular_user, event_creator_user):
+    """Тест: список пользователей фильтруется по роли и делится на страницы в БД"""
+    with app.app_context():
+        page = AdminService.get_users_page(role='user', page=1, per_page=1)
+        assert page.total == 1
+        assert [u.id for u in page.items] == [regular_user]
+        
+        page = AdminService.get_users_page(page=2, per_page=2)
+        assert page.total == 3
+        assert len(page.items) == 1
+        
+        assert AdminService.get_users_page(role='unknown').total == 0
+
+
+def test_admin_users_page_etag(client, app, admin_user, regular_user):
+    """Тест: список пользователей отвечает 304, пока данные не изменились"""
+    app.config['ADMIN_ETAGS_ENABLED'] = True
+    with app.app_context():
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin_user
+            sess['user_role'] = 'admin'
+        
+        response = client.get('/admin/users')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        
+        response = client.get('/admin/users', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        
+        # ETag сжатого ответа, который браузер присылает обратно
+        compressed_etag = etag[:-1] + ':gzip"'
+        response = client.get('/admin/users', headers={'If-None-Match': compressed_etag})
+        assert response.status_code == 304
+        
+        # Блокировка пользователя меняет версию данных
+        AdminService.block_user(regular_user)
+        response = client.get('/admin/users', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+
 def test_admin_statistics(app, admin_user, regular_user):
     """Тест: получение статистики системы (Требование 5.1)"""
     with app.app_context():
@@ -13,9 +13,8 @@ from services import AnalyticsService, UserService, EventCreatorService, Masterc
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
@@ -128,6 +127,23 @@ def test_get_creator_stats(creator_with_masterclasses):
     assert 'total_reviews' in stats
 
 
+def test_creator_stats_cache_invalidated_on_registration(creator_with_masterclasses):
+    """Тест: новая регистрация сбрасывает кэшированную статистику создателя"""
+    data = creator_with_masterclasses
+    assert AnalyticsService.get_creator_stats(data['creator_id'])['total_participants'] == 20
+
+    masterclass = db.session.get(Masterclass, data['upcoming_mc_id'])
+    db.session.add(Registration(
+        masterclass_id=masterclass.id,
+        user_name='Late User',
+        user_email='late@test.com'
+    ))
+    masterclass.current_participants += 1
+    db.session.commit()
+
+    assert AnalyticsService.get_creator_stats(data['creator_id'])['total_participants'] == 21
+
+
 def test_get_masterclass_analytics(creator_with_masterclasses):
     """
     Тест получения аналитики конкретного мастер-класса
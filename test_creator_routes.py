@@ -13,9 +13,8 @@ from services import UserService, EventCreatorService, MasterclassService
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
@@ -91,6 +90,29 @@ def test_creator_dashboard_requires_login(client):
     assert b'login' in response.data.lower() or 'войдите'.encode('utf-8') in response.data.lower()
 
 
+def test_get_user_with_creator(app, event_creator_user):
+    """Тест: пользователь загружается вместе с профилем создателя"""
+    with app.app_context():
+        db.session.expunge_all()
+        user = UserService.get_user_with_creator(event_creator_user)
+
+        assert user is not None
+        assert 'event_creator_profile' in user.__dict__
+        assert user.event_creator_profile.company_name == 'Test Company'
+
+
+def test_creator_profile_cache_invalidated_on_update(app, event_creator_user):
+    """Тест: изменение профиля создателя сбрасывает его кэш"""
+    app.config['USER_CACHE_ENABLED'] = True
+    with app.app_context():
+        creator = EventCreator.get_by_user_id(event_creator_user)
+        assert EventCreatorService.update_creator_profile(creator.id, company_name='Renamed')
+        db.session.expunge_all()
+
+        user = UserService.get_user_with_creator(event_creator_user)
+        assert user.event_creator_profile.company_name == 'Renamed'
+
+
 def test_create_masterclass(client, event_creator_user, app):
     """
     Тест создания мастер-класса
@@ -18,9 +18,8 @@ from error_handlers import (
 @pytest.fixture
 def app():
     """Create and configure a test app instance"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
@@ -401,3 +400,94 @@ def test_concurrent_registration_limit(app, event_creator):
         db.session.refresh(masterclass)
         assert masterclass.current_participants == 1
         assert masterclass.is_full is True
+
+
+def test_integrity_error_message_for_duplicate_registration(app, event_creator):
+    """
+    Тест сообщения об ошибке целостности при повторной регистрации
+    Требование: 5.4
+    """
+    from sqlalchemy.exc import IntegrityError
+    from error_handlers import _integrity_error_message
+    
+    with app.app_context():
+        future_date = datetime.utcnow() + timedelta(days=7)
+        masterclass = MasterclassService.create_masterclass(
+            creator_id=event_creator,
+            title='Integrity Masterclass',
+            description='Test',
+            date_time=future_date,
+            max_participants=10,
+            price=1000
+        )
+        
+        for _ in range(2):
+            db.session.add(Registration(
+                masterclass_id=masterclass.id,
+                user_name='Test User',
+                user_email='dup@test.com'
+            ))
+        
+        with pytest.raises(IntegrityError) as exc_info:
+            db.session.commit()
+        db.session.rollback()
+        
+        assert _integrity_error_message(exc_info.value) == "Вы уже зарегистрированы на этот мастер-класс."
+
+
+def test_custom_error_dispatch(app):
+    """
+    Тест диспетчеризации кастомных ошибок единым обработчиком
+    Требования: 1.4, 3.4
+    """
+    from error_handlers import dispatch_masterclass_error
+    
+    with app.test_request_context('/'):
+        response = dispatch_masterclass_error(MasterclassFullError('Full Masterclass'))
+        assert response.status_code == 302
+        
+        # Подкласс без собственной записи обрабатывается как TimeConstraintError
+        response = dispatch_masterclass_error(CancellationTooLateError('Soon Masterclass', 5.0))
+        assert response.status_code == 302
+        
+        # Ошибки без обработчика пробрасываются дальше
+        with pytest.raises(DatabaseConnectionError):
+            dispatch_masterclass_error(DatabaseConnectionError(Exception('down')))
+
+
+def test_custom_errors_pickle_roundtrip():
+    """
+    Тест сериализации кастомных ошибок (поля хранятся в __slots__)
+    """
+    import pickle
+    
+    errors = [
+        MasterclassFullError('Full Masterclass'),
+        DuplicateRegistrationError('test@test.com', 'Test Masterclass'),
+        CancellationTooLateError('Soon Masterclass', 5.0),
+        DataValidationError('user_email', 'Некорректный email'),
+    ]
+    for error in errors:
+        restored = pickle.loads(pickle.dumps(error))
+        assert type(restored) is type(error)
+        assert str(restored) == str(error)
+
+
+def test_database_errors_use_single_handler(app):
+    """
+    Тест обработки подклассов DatabaseError единым обработчиком
+    Требование: 5.4
+    """
+    from sqlalchemy.exc import OperationalError, IntegrityError
+    
+    @app.route('/test-operational-error')
+    def raise_operational_error():
+        raise OperationalError('SELECT 1', {}, Exception('database is locked'))
+    
+    @app.route('/test-integrity-error')
+    def raise_integrity_error():
+        raise IntegrityError('INSERT', {}, Exception('constraint failed'))
+    
+    client = app.test_client()
+    assert client.get('/test-operational-error').status_code == 503
+    assert client.get('/test-integrity-error').status_code == 400
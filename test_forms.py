@@ -16,10 +16,9 @@ from forms import (
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     
     with app.app_context():
         db.create_all()
@@ -262,6 +261,36 @@ def test_advanced_search_form_invalid_date_range(app):
         assert 'date_to' in form.errors
 
 
+def test_advanced_search_form_empty(app):
+    """Тест пустой формы расширенного поиска и некорректного ввода цены"""
+    from werkzeug.datastructures import MultiDict
+    
+    with app.test_request_context():
+        form = AdvancedSearchForm(formdata=MultiDict())
+        assert form.validate()
+        
+        form = AdvancedSearchForm(formdata=MultiDict({'price_min': 'abc'}))
+        assert not form.validate()
+        assert 'price_min' in form.errors
+
+
+def test_advanced_search_form_date_parsing(app):
+    """Тест разбора дат в форме расширенного поиска"""
+    from werkzeug.datastructures import MultiDict
+    
+    with app.test_request_context():
+        form = AdvancedSearchForm(formdata=MultiDict({'date_from': '2024-03-05'}))
+        assert form.date_from.data == datetime(2024, 3, 5)
+        
+        # Не дополненная нулями дата разбирается через strptime
+        form = AdvancedSearchForm(formdata=MultiDict({'date_from': '2024-3-5'}))
+        assert form.date_from.data == datetime(2024, 3, 5)
+        
+        form = AdvancedSearchForm(formdata=MultiDict({'date_from': '2024-13-05'}))
+        assert form.date_from.data is None
+        assert not form.validate()
+
+
 def test_event_creator_profile_form_valid(app):
     """Тест валидной формы профиля создателя ивентов"""
     with app.test_request_context():
@@ -4,20 +4,18 @@
 """
 
 import pytest
-import os
 from datetime import datetime, timedelta
 from flask import Flask
 from app import create_app
 from extensions import db, mail
 from models import User, EventCreator, Masterclass, Registration, Notification
-from services import NotificationService, EmailService
+from services import NotificationService, EmailService, MasterclassService
 
 
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     with app.app_context():
         db.create_all()
         yield app
@@ -242,6 +240,28 @@ class TestNotificationService:
             count = NotificationService.get_unread_count(user.id)
             assert count == 5
     
+    def test_prune_read_notifications(self, app, sample_user):
+        """Тест очистки старых прочитанных уведомлений"""
+        with app.app_context():
+            user = db.session.merge(sample_user)
+            
+            old_date = datetime.utcnow() - timedelta(days=40)
+            db.session.add_all([
+                Notification(user_id=user.id, type='update', title='Old read', message='M',
+                             is_read=True, created_at=old_date),
+                Notification(user_id=user.id, type='update', title='Old unread', message='M',
+                             is_read=False, created_at=old_date),
+                Notification(user_id=user.id, type='update', title='New read', message='M',
+                             is_read=True),
+            ])
+            db.session.commit()
+            
+            deleted = NotificationService.prune_read_notifications(older_than_days=30, batch_size=1)
+            assert deleted == 1
+            
+            titles = {n.title for n in Notification.query.filter_by(user_id=user.id).all()}
+            assert titles == {'Old unread', 'New read'}
+    
     def test_send_status_update(self, app, sample_masterclass):
         """Тест отправки уведомления об обновлении статуса - Требование: 7.1, 7.5"""
         with app.app_context():
@@ -323,7 +343,89 @@ class TestNotificationService:
                 assert count == 1
                 assert len(outbox) == 1
                 assert 'Напоминание' in outbox[0].subject
+
+                # Повторный запуск в том же окне не отправляет напоминания снова
+                assert NotificationService.send_reminders_for_upcoming_masterclasses() == 0
+                assert len(outbox) == 1
+
+    def test_failed_reminders_are_retried(self, app, sample_creator, monkeypatch):
+        """Тест: повторный запуск отправляет напоминания только тем, кому они не ушли"""
+        with app.app_context():
+            creator = db.session.merge(sample_creator)
+            masterclass = Masterclass(
+                creator_id=creator.id,
+                title='Retry Masterclass',
+                description='Test',
+                date_time=datetime.utcnow() + timedelta(hours=24),
+                max_participants=10,
+                price=1000.00
+            )
+            db.session.add(masterclass)
+            db.session.flush()
+            for email in ('ok@example.com', 'retry@example.com'):
+                user = User(email=email, name=email, role='user')
+                user.set_password('password')
+                db.session.add(user)
+                db.session.add(Registration(
+                    masterclass_id=masterclass.id,
+                    user_name=email,
+                    user_email=email
+                ))
+            db.session.commit()
+            masterclass_id = masterclass.id
+            
+            send_reminder_email = EmailService.send_reminder_email
+            def flaky_send(user_email, *args, **kwargs):
+                if user_email == 'retry@example.com':
+                    return False
+                return send_reminder_email(user_email, *args, **kwargs)
+            monkeypatch.setattr(EmailService, 'send_reminder_email', staticmethod(flaky_send))
+            with mail.record_messages() as outbox:
+                assert NotificationService.send_reminders_for_upcoming_masterclasses() == 1
+                assert [m.recipients for m in outbox] == [['ok@example.com']]
+            
+            monkeypatch.undo()
+            with mail.record_messages() as outbox:
+                assert NotificationService.send_reminders_for_upcoming_masterclasses() == 1
+                assert [m.recipients for m in outbox] == [['retry@example.com']]
+            assert NotificationService.send_reminders_for_upcoming_masterclasses() == 0
+            
+            # Каждый участник получил одно системное напоминание
+            assert Notification.query.filter_by(type='reminder').count() == 2
+            assert Registration.query.filter_by(masterclass_id=masterclass_id,
+                                                reminder_sent=False).count() == 0
     
+    def test_reschedule_resets_reminders(self, app, sample_creator):
+        """Тест: перенос мастер-класса снова включает напоминания участникам"""
+        with app.app_context():
+            with mail.record_messages() as outbox:
+                creator = db.session.merge(sample_creator)
+                masterclass = Masterclass(
+                    creator_id=creator.id,
+                    title='Moved Masterclass',
+                    description='Test',
+                    date_time=datetime.utcnow() + timedelta(hours=24),
+                    max_participants=10,
+                    price=1000.00
+                )
+                db.session.add(masterclass)
+                db.session.flush()
+                db.session.add(Registration(
+                    masterclass_id=masterclass.id,
+                    user_name='Moved User',
+                    user_email='moved@example.com'
+                ))
+                db.session.commit()
+                masterclass_id = masterclass.id
+                
+                assert NotificationService.send_reminders_for_upcoming_masterclasses() == 1
+                
+                # Перенос на полчаса остается в окне рассылки
+                assert MasterclassService.update_masterclass(
+                    masterclass_id, date_time=datetime.utcnow() + timedelta(hours=24, minutes=30))
+                assert NotificationService.send_reminders_for_upcoming_masterclasses() == 1
+                assert len(outbox) == 2
+
     def test_send_cancellation_notification(self, app, sample_masterclass):
         """Тест отправки уведомления об отмене - Требование: 7.3"""
         with app.app_context():
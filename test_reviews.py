@@ -6,16 +6,15 @@ import pytest
 from datetime import datetime, timedelta
 from app import create_app
 from extensions import db
-from models import User, EventCreator, Masterclass, Registration, Review
-from services import ReviewService
+from models import User, EventCreator, Masterclass, Registration, Review, Favorite
+from services import ReviewService, MasterclassService
 
 
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
@@ -268,5 +267,111 @@ def test_can_user_review(app, sample_data):
         assert can_review == False
 
 
+def test_delete_masterclass_removes_reviews_and_favorites(app, sample_data):
+    """
+    Тест: удаление мастер-класса удаляет его отзывы и избранное
+    Требования: 10.4
+    """
+    with app.app_context():
+        user = User.query.filter_by(email='user@test.com').first()
+        masterclass = Masterclass.query.filter_by(title='Past Masterclass').first()
+        masterclass_id = masterclass.id
+        
+        ReviewService.create_review(user_id=user.id, masterclass_id=masterclass_id, rating=5)
+        db.session.add(Favorite(user_id=user.id, masterclass_id=masterclass_id))
+        db.session.commit()
+        
+        assert MasterclassService.delete_masterclass(masterclass_id) is True
+        assert Review.query.filter_by(masterclass_id=masterclass_id).count() == 0
+        assert Favorite.query.filter_by(masterclass_id=masterclass_id).count() == 0
+
+
+def test_rating_counters_follow_review_changes(app, sample_data):
+    """
+    Тест денормализованных счетчиков рейтинга мастер-класса
+    Требования: 10.4
+    """
+    with app.app_context():
+        user = User.query.filter_by(email='user@test.com').first()
+        masterclass = Masterclass.query.filter_by(title='Past Masterclass').first()
+        
+        review = ReviewService.create_review(
+            user_id=user.id,
+            masterclass_id=masterclass.id,
+            rating=4
+        )
+        assert (masterclass.rating_sum, masterclass.rating_count) == (4, 1)
+        
+        # Изменение оценки
+        ReviewService.update_review(review.id, user.id, rating=2)
+        assert (masterclass.rating_sum, masterclass.rating_count) == (2, 1)
+        
+        # Отклоненный отзыв не учитывается в рейтинге
+        ReviewService.reject_review(review.id)
+        assert (masterclass.rating_sum, masterclass.rating_count) == (0, 0)
+        assert ReviewService.get_masterclass_average_rating(masterclass.id) is None
+        
+        ReviewService.approve_review(review.id)
+        assert masterclass.avg_rating == 2.0
+        assert Masterclass.query.filter(Masterclass.avg_rating >= 2).count() == 1
+        
+        ReviewService.delete_review(review.id)
+        assert (masterclass.rating_sum, masterclass.rating_count) == (0, 0)
+        assert ReviewService.get_masterclass_review_count(masterclass.id) == 0
+
+
+def test_rating_counters_backfill(app, sample_data):
+    """
+    Тест: upgrade_db пересчитывает счетчики рейтинга по одобренным отзывам
+    Требования: 10.4
+    """
+    from sqlalchemy import update
+    from upgrade_db import upgrade_rating_counters
+    
+    with app.app_context():
+        user = User.query.filter_by(email='user@test.com').first()
+        masterclass = Masterclass.query.filter_by(title='Past Masterclass').first()
+        ReviewService.create_review(user_id=user.id, masterclass_id=masterclass.id, rating=4)
+        
+        # Значения по умолчанию, которые получают строки при добавлении колонок
+        db.session.execute(update(Masterclass).values(rating_sum=0, rating_count=0))
+        db.session.commit()
+        
+        upgrade_rating_counters()
+        db.session.commit()
+        db.session.expire_all()
+        assert (masterclass.rating_sum, masterclass.rating_count) == (4, 1)
+
+
+def test_bulk_moderation_updates_rating_counters(app, sample_data):
+    """
+    Тест массовой модерации отзывов: счетчики рейтинга сдвигаются одним запросом
+    Требования: 10.4
+    """
+    with app.app_context():
+        user = User.query.filter_by(email='user@test.com').first()
+        masterclass = Masterclass.query.filter_by(title='Past Masterclass').first()
+        
+        review = ReviewService.create_review(
+            user_id=user.id,
+            masterclass_id=masterclass.id,
+            rating=5
+        )
+        review_id = review.id
+        
+        assert ReviewService.bulk_moderate([review_id], 'reject') == 1
+        assert (masterclass.rating_sum, masterclass.rating_count) == (0, 0)
+        
+        # Повторное отклонение ничего не меняет
+        assert ReviewService.bulk_moderate([review_id], 'reject') == 0
+        
+        assert ReviewService.bulk_moderate([review_id], 'approve') == 1
+        assert (masterclass.rating_sum, masterclass.rating_count) == (5, 1)
+        
+        assert ReviewService.bulk_moderate([review_id], 'delete') == 1
+        assert (masterclass.rating_sum, masterclass.rating_count) == (0, 0)
+        assert ReviewService.bulk_moderate([review_id], 'unknown') == 0
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
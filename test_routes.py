@@ -14,8 +14,7 @@ from models import User, EventCreator, Masterclass, Registration
 
 def test_public_routes():
     """Test that public routes work correctly"""
-    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     
     with app.app_context():
         # Create test data
@@ -86,6 +85,24 @@ def test_public_routes():
         assert response.status_code == 200
         assert b'Test Masterclass' in response.data
         print("✓ Category filter works")
+        
+        # Пустой список при ошибке БД не берется из кэша карточек и не попадает в него
+        from services import MasterclassService
+        from error_handlers import DatabaseConnectionError
+        original = MasterclassService.get_available_masterclasses_cached
+        def failing(category=None):
+            raise DatabaseConnectionError('connection refused')
+        MasterclassService.get_available_masterclasses_cached = staticmethod(failing)
+        try:
+            response = client.get('/')
+        finally:
+            MasterclassService.get_available_masterclasses_cached = original
+        assert response.status_code == 200
+        assert b'Test Masterclass' not in response.data
+        
+        response = client.get('/')
+        assert b'Test Masterclass' in response.data
+        print("✓ Database error page is not cached")
 
 def main():
     """Run all tests"""
@@ -13,9 +13,8 @@ from services import SearchService, ReviewService
 @pytest.fixture
 def app():
     """Создать тестовое приложение"""
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['WTF_CSRF_ENABLED'] = False
     
     with app.app_context():
@@ -251,6 +250,48 @@ def test_sort_by_popularity(app, sample_data):
         assert results[0].current_participants >= results[-1].current_participants
 
 
+def test_sort_by_title_ignores_case(app, sample_data):
+    """
+    Тест сортировки по названию без учета регистра (включая кириллицу)
+    Требование: 8.4
+    """
+    with app.app_context():
+        creator = EventCreator.query.first()
+        db.session.add(Masterclass(
+            creator_id=creator.id,
+            title='акварель для всех',
+            date_time=datetime.utcnow() + timedelta(days=3),
+            max_participants=10,
+            is_active=True
+        ))
+        db.session.commit()
+        
+        results = SearchService.search_masterclasses(sort_by='title', sort_order='asc')
+        titles = [mc.title for mc in results]
+        assert 'акварель для всех' in titles
+        assert titles == sorted(titles, key=str.casefold)
+
+
+def test_autocomplete_ignores_cyrillic_case(app, sample_data):
+    """
+    Тест автодополнения без учета регистра кириллицы
+    Требование: 8.5
+    """
+    with app.app_context():
+        creator = EventCreator.query.first()
+        db.session.add(Masterclass(
+            creator_id=creator.id,
+            title='Питон для всех',
+            date_time=datetime.utcnow() + timedelta(days=3),
+            max_participants=10,
+            is_active=True
+        ))
+        db.session.commit()
+        
+        assert 'Питон для всех' in SearchService.get_autocomplete_suggestions_cached('Пит')
+        assert 'Питон для всех' in SearchService.get_autocomplete_suggestions_cached('пИТ')
+
+
 def test_combined_filters(app, sample_data):
     """
     Тест комбинированных фильтров
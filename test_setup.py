@@ -9,8 +9,9 @@ from datetime import datetime, timedelta
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app
-from extensions import db
-from models import User, EventCreator, Masterclass, Registration
+from extensions import db, cache
+from models import User, EventCreator, Masterclass, Registration, ROLE_ADMIN, ROLE_EVENT_CREATOR
+from services import MasterclassService
 
 def test_app_creation():
     """Test that the Flask app can be created"""
@@ -21,8 +22,7 @@ def test_app_creation():
 def test_database_models():
     """Test that database models work correctly"""
     # Set environment variable before creating app
-    os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
-    app = create_app()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     
     with app.app_context():
         # Test User model
@@ -122,6 +122,123 @@ def test_database_models():
             db.session.rollback()
             print("✓ Unique constraint works correctly")
 
+def test_password_hash_migration():
+    """Test that legacy werkzeug hashes are verified and upgraded to Argon2id"""
+    from werkzeug.security import generate_password_hash
+    
+    user = User(email='legacy@example.com', name='Legacy User', role='user')
+    user.password_hash = generate_password_hash('legacypass')
+    
+    assert not user.check_password('wrongpass')
+    assert not user.password_hash.startswith('$argon2')
+    
+    assert user.check_password('legacypass')
+    assert user.password_hash.startswith('$argon2id')
+    assert user.check_password('legacypass')
+    assert not user.check_password('wrongpass')
+    print("✓ Password hash migration works correctly")
+
+def test_email_normalization():
+    """Test that emails are stored lowercased so plain indexes serve lookups"""
+    user = User(email='  Mixed.Case@Example.COM ', name='Mixed Case', role='user')
+    assert user.email == 'mixed.case@example.com'
+    
+    registration = Registration(masterclass_id=1, user_name='Mixed Case', user_email='Mixed.Case@Example.COM')
+    assert registration.user_email == 'mixed.case@example.com'
+    print("✓ Email normalization works correctly")
+
+def test_role_flags():
+    """Test that the role bitmask follows the role and is usable in SQL"""
+    user = User(email='creator@example.com', name='Creator', role='event_creator')
+    assert user.role_flags == ROLE_EVENT_CREATOR
+    assert user.is_event_creator() and not user.is_admin()
+    
+    user.role = 'admin'
+    assert user.has_role(ROLE_ADMIN) and not user.has_role(ROLE_EVENT_CREATOR)
+    assert '&' in str(User.has_role(ROLE_ADMIN))
+    
+    # Без явной роли - роль по умолчанию, как у колонки
+    user = User(email='plain@example.com', name='Plain')
+    assert user.role == 'user' and not user.is_admin()
+    print("✓ Role flags work correctly")
+
+def test_role_flags_backfill():
+    """Test that upgrade_db restores role flags of rows created before the column existed"""
+    from sqlalchemy import update
+    from upgrade_db import upgrade_role_flags
+    
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    
+    with app.app_context():
+        admin = User(email='old-admin@example.com', name='Old Admin', role='admin')
+        admin.set_password('adminpass')
+        db.session.add(admin)
+        db.session.commit()
+        # Значение по умолчанию, которое получают строки при добавлении колонки
+        db.session.execute(update(User).values(role_flags=1))
+        db.session.commit()
+        
+        upgrade_role_flags()
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(User, admin.id).is_admin()
+        print("✓ Role flags backfill works correctly")
+
+def test_user_cache():
+    """Test that cached user lookups skip SQL and are invalidated on update"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    app.config['USER_CACHE_ENABLED'] = True
+    
+    with app.app_context():
+        user = User(email='cached@example.com', name='Cached User', role='user')
+        user.set_password('cachedpass')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        
+        assert User.get_by_email('Cached@Example.com').id == user_id
+        db.session.remove()
+        
+        cached = User.get_by_id(user_id)
+        assert cached.name == 'Cached User'
+        assert 'password_hash' not in cache.get(f'user:{user_id}')
+        assert cached.check_password('cachedpass')
+        
+        cached.name = 'Renamed User'
+        db.session.commit()
+        db.session.remove()
+        assert User.get_by_id(user_id).name == 'Renamed User'
+        print("✓ User cache works correctly")
+
+def test_popular_masterclasses_view():
+    """Test that the popular masterclasses view ranks upcoming masterclasses"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    
+    with app.app_context():
+        user = User(email='popular@example.com', name='Popular Creator', role='event_creator')
+        user.set_password('popularpass')
+        db.session.add(user)
+        db.session.commit()
+        creator = EventCreator(user_id=user.id, company_name='Popular Company')
+        db.session.add(creator)
+        db.session.commit()
+        
+        future_date = datetime.utcnow() + timedelta(days=7)
+        quiet = Masterclass(creator_id=creator.id, title='Quiet', date_time=future_date,
+                            max_participants=10, current_participants=1)
+        busy = Masterclass(creator_id=creator.id, title='Busy', date_time=future_date,
+                           max_participants=10, current_participants=5)
+        past = Masterclass(creator_id=creator.id, title='Past', date_time=datetime.utcnow() - timedelta(days=1),
+                           max_participants=10, current_participants=9)
+        db.session.add_all([quiet, busy, past])
+        db.session.commit()
+        
+        assert MasterclassService.refresh_popular_masterclasses()
+        popular = MasterclassService.get_popular_masterclasses(limit=5)
+        assert [p.title for p in popular] == ['Busy', 'Quiet']
+        assert popular[0].score == 5
+        print("✓ Popular masterclasses view works correctly")
+
 def main():
     """Run all tests"""
     print("Testing Flask app and database setup...")
@@ -129,6 +246,12 @@ def main():
     try:
         test_app_creation()
         test_database_models()
+        test_password_hash_migration()
+        test_email_normalization()
+        test_role_flags()
+        test_role_flags_backfill()
+        test_user_cache()
+        test_popular_masterclasses_view()
         print("\n✅ All tests passed! Setup is working correctly.")
     except Exception as e:
         print(f"\n❌ Test failed: {e}")
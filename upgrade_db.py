@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Скрипт обновления существующей базы данных до текущих моделей
+
+db.create_all() создает только недостающие таблицы: новые колонки в уже
+существующих таблицах он не добавляет. Скрипт добавляет их и заполняет
+данными. Запускается один раз после обновления кода; повторный запуск безопасен.
+
+Пример использования:
+cd /path/to/app && /path/to/venv/bin/python upgrade_db.py
+"""
+
+import sys
+import logging
+from sqlalchemy import inspect, text
+from app import create_app
+from extensions import db
+from models import ROLE_FLAGS, ROLE_USER
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _quote(name):
+    return db.engine.dialect.identifier_preparer.quote(name)
+
+
+def _add_column(table, column, ddl):
+    """Добавить колонку, если ее еще нет; True - колонка добавлена"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column in columns:
+        return False
+    db.session.execute(text(f'ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)} {ddl}'))
+    logger.info(f"Added column {table}.{column}")
+    return True
+
+
+def upgrade_role_flags():
+    """
+    User.role_flags: битовая маска ролей, по которой проверяются права.
+    Без заполнения существующие администраторы и создатели получили бы ROLE_USER.
+    """
+    _add_column('user', 'role_flags', f'SMALLINT NOT NULL DEFAULT {ROLE_USER}')
+    cases = ' '.join(f"WHEN '{role}' THEN {flag}" for role, flag in ROLE_FLAGS.items())
+    db.session.execute(text(
+        f'UPDATE {_quote("user")} SET role_flags = CASE role {cases} ELSE {ROLE_USER} END'
+    ))
+
+
+def upgrade_rating_counters():
+    """
+    Masterclass.rating_sum/rating_count: денормализованный рейтинг, который дальше
+    поддерживают события Review. Пересчитывается по одобренным отзывам целиком,
+    поэтому повторный запуск исправляет и разошедшиеся счетчики.
+    """
+    _add_column('masterclass', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column('masterclass', 'rating_count', 'INTEGER NOT NULL DEFAULT 0')
+    approved = 'FROM review WHERE review.masterclass_id = masterclass.id AND review.is_approved'
+    db.session.execute(text(
+        f'UPDATE masterclass SET '
+        f'rating_sum = (SELECT COALESCE(SUM(review.rating), 0) {approved}), '
+        f'rating_count = (SELECT COUNT(*) {approved})'
+    ))
+
+
+def upgrade_reminder_sent():
+    """
+    Registration.reminder_sent: напоминание участнику отправлено.
+    Существующие строки получают FALSE - регистрации на уже прошедшие мастер-классы
+    в окно рассылки все равно не попадут.
+    """
+    _add_column('registration', 'reminder_sent', 'BOOLEAN NOT NULL DEFAULT FALSE')
+
+
+# Шаги выполняются по порядку, каждый - идемпотентный
+UPGRADE_STEPS = [
+    upgrade_role_flags,
+    upgrade_rating_counters,
+    upgrade_reminder_sent,
+]
+
+
+def upgrade():
+    """Выполнить все шаги обновления схемы"""
+    app = create_app()
+    with app.app_context():
+        try:
+            for step in UPGRADE_STEPS:
+                logger.info(f"Running {step.__name__}...")
+                step()
+                db.session.commit()
+            logger.info("Database upgrade completed")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Database upgrade failed: {e}", exc_info=True)
+            return False
+        finally:
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if upgrade() else 1)